@@ -21,3 +21,7 @@ async def async_setup_entry(hass, entry):
     """Set up Neva MT Counter from a config entry."""
     await hass.config_entries.async_forward_entry_setups(entry, ["sensor"])
     return True
+
+async def async_unload_entry(hass, entry):
+    """Unload Neva MT Counter config entry."""
+    return await hass.config_entries.async_unload_platforms(entry, ["sensor"])
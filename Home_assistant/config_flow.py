@@ -2,7 +2,7 @@ import logging
 from homeassistant import config_entries
 import voluptuous as vol
 
-from .const import DOMAIN
+from .const import DEFAULT_PASSWORD, DOMAIN
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -19,6 +19,7 @@ class NevaMTConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
 
         data_schema = {
             vol.Required("port"): str,
+            vol.Optional("password", default=DEFAULT_PASSWORD): str,
         }
 
         return self.async_show_form(
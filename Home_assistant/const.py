@@ -1,2 +1,3 @@
 """Constants for the Neva MT Counter integration."""
-DOMAIN = "neva_mt"
\ No newline at end of file
+DOMAIN = "neva_mt"
+DEFAULT_PASSWORD = "00000000"  # заводской пароль счётчика
\ No newline at end of file
@@ -1,28 +1,32 @@
 import argparse
 from .neva_mt_counter.library.NevaMt3xx import NevaMt3xx_com
+from .neva_mt_counter.library.Session import Session
+from .neva_mt_counter.library import Obis, ObisDecoders, ReadCache
+from .const import DEFAULT_PASSWORD
 
 class NevaCommands:
-    def __init__(self, port):
+    def __init__(self, port, password=DEFAULT_PASSWORD):
         self.counter = NevaMt3xx_com(port=port)
+        # Сеанс (подключение и авторизация паролем счётчика) сохраняется между опросами;
+        # неизменяемые значения и архивы прошедших суток не считываются повторно (ReadCache)
+        self.session = Session(self.counter, password, cache=ReadCache.ReadCache())
+
+    def start_keep_alive(self):
+        """Запуск поддержания сеанса между опросами."""
+        self.session.start_keep_alive()
+
+    def close(self):
+        """Остановка поддержания сеанса и завершение сеанса."""
+        self.session.stop_keep_alive()
+        try:
+            self.session.close()
+        except Exception as e:
+            print(f"Error closing session: {e}")
 
     def read_parameter(self, obis_code):
         """Чтение параметра по OBIS-коду."""
         try:
-            # Подключение и авторизация
-            company, device = self.counter.connect()
-            if not company or not device:
-                raise Exception("Failed to connect to the counter")
-
-            # Отправка команды
-            command = ('R1', f"{obis_code}()")
-            self.counter.send(self.counter.Command(command[0], command[1]))
-            response = self.counter.receive()
-
-            # Обработка ответа
-            if response.is_message:
-                return response.data.strip('()')
-            else:
-                raise Exception("Invalid response from the counter")
+            return self.session.read(obis_code)
         except Exception as e:
             print(f"Error reading parameter: {e}")
             return None
@@ -43,9 +47,20 @@ class NevaCommands:
             "date_time": "000902FF",
         }
 
+        try:
+            snapshot = self.session.read_many(obis_codes.values(), decode=False)
+        except Exception as e:
+            print(f"Error reading parameters: {e}")
+            return dict.fromkeys(obis_codes)
+
         results = {}
         for key, obis_code in obis_codes.items():
-            value = self.read_parameter(obis_code)
-            results[key] = float(value) if value and value.replace('.', '', 1).isdigit() else value
+            error = snapshot.errors.get(Obis.Obis(obis_code))
+            if error is not None:
+                print(f"Error reading parameter {key}: {error}")
+            # состояние сенсоров прежнее: число (float) или текст, без типов ObisDecoders
+            value = snapshot.get(obis_code)
+            number = None if value is None else ObisDecoders.parse_number(value)
+            results[key] = value if number is None else float(number)
 
         return results
\ No newline at end of file
@@ -3,6 +3,8 @@ from datetime import timedelta
 from homeassistant.components.sensor import SensorEntity, SensorDeviceClass
 from homeassistant.helpers.update_coordinator import DataUpdateCoordinator
 
+from .const import DEFAULT_PASSWORD
+
 _LOGGER = logging.getLogger(__name__)
 
 DOMAIN = "neva_mt"
@@ -12,9 +14,12 @@ async def async_setup_entry(hass, entry, async_add_entities):
     from .neva_commands import NevaCommands  # Импортируем новый класс
 
     port = entry.data["port"]  # Порт для подключения к счетчику
+    password = entry.data.get("password", DEFAULT_PASSWORD)  # Пароль счетчика
 
     # Создаем экземпляр класса NevaCommands
-    neva_commands = NevaCommands(port)
+    neva_commands = NevaCommands(port, password)
+    # Сеанс и поток поддержания сеанса завершаются при выгрузке интеграции
+    entry.async_on_unload(lambda: hass.async_create_task(hass.async_add_executor_job(neva_commands.close)))
 
     async def async_update_data():
         """Fetch data from the counter."""
@@ -29,6 +34,8 @@ async def async_setup_entry(hass, entry, async_add_entities):
     )
 
     await coordinator.async_config_entry_first_refresh()
+    # Поддержание сеанса запускается после первого опроса
+    neva_commands.start_keep_alive()
 
     sensors = [
         NevaMTSensor(coordinator, f"{port}_voltage_phase_a", "Voltage Phase A", SensorDeviceClass.VOLTAGE, "V"),
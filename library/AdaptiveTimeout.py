@@ -0,0 +1,97 @@
+#!/usr/bin/env python2
+# coding: utf-8
+
+import time
+
+
+class AdaptiveTimeout:
+	"""Адаптивный таймаут по сглаженному времени (SRTT) и его отклонению (RTTVAR),
+	вычисляемым по наблюдаемым обменам аналогично RFC 6298:
+	timeout = SRTT + k * RTTVAR, не менее minimum; при истечении таймаута он удваивается (не более maximum).
+	Нижняя граница 1 с (RFC 6298, 2.4): таймаут, обученный на быстрых ответах R1, не должен
+	обрывать медленные ответы (например, профиль 63.01.00)"""
+
+	def __init__(self, initial=2., minimum=1., maximum=10., k=4, alpha=1 / 8, beta=1 / 4):
+		"""initial -- seconds, timeout before the first sample
+		minimum -- seconds, lower bound of the timeout"""
+		self.minimum = minimum
+		self.maximum = maximum
+		self.k = k
+		self.alpha = alpha
+		self.beta = beta
+		self.srtt = None
+		self.rttvar = None
+		self.value = min(max(initial, minimum), maximum)
+
+	def update(self, sample):
+		"""Adds observed time, seconds"""
+		if self.srtt is None:
+			self.srtt = sample
+			self.rttvar = sample / 2
+		else:
+			self.rttvar = (1 - self.beta) * self.rttvar + self.beta * abs(self.srtt - sample)
+			self.srtt = (1 - self.alpha) * self.srtt + self.alpha * sample
+		self.value = min(max(self.srtt + self.k * self.rttvar, self.minimum), self.maximum)
+
+	def backoff(self):
+		"""Timeout expired"""
+		self.value = min(self.value * 2, self.maximum)
+
+	def timeout(self):
+		return self.value
+
+	def __str__(self):
+		return 'timeout {:.3f} s; srtt {}; rttvar {}'.format(
+			self.value,
+			'-' if self.srtt is None else '{:.3f} s'.format(self.srtt),
+			'-' if self.rttvar is None else '{:.3f} s'.format(self.rttvar))
+
+
+class LinkTimeouts:
+	"""Таймауты канала связи со счётчиком: ожидание ответа (от передачи до первого
+	принятого байта) и межбайтовый интервал внутри ответа; обучаются по обменам.
+	Used by NevaMt3xx_com, NevaMt3xx_tcp & NevaMt3xx_async:
+	sent() after request, timeout() before every read, received() after every read,
+	frame_received() after answer & expired() after read timeout.
+	The gap is not less than .3 s: USB & TCP converters deliver an answer in chunks with pauses."""
+
+	def __init__(self, response=None, gap=None):
+		self.response = AdaptiveTimeout() if response is None else response
+		self.gap = AdaptiveTimeout(initial=1., minimum=.3, maximum=2.) if gap is None else gap
+		self._sent_time = None
+		self._received_time = None
+		self._max_gap = 0.
+
+	def _reset(self):
+		self._sent_time = None
+		self._received_time = None
+		self._max_gap = 0.
+
+	def sent(self):
+		self._reset()
+		self._sent_time = time.monotonic()
+
+	def timeout(self):
+		"""Returns seconds to wait for the next bytes"""
+		return self.response.timeout() if self._received_time is None else self.gap.timeout()
+
+	def received(self):
+		now = time.monotonic()
+		if self._received_time is None:
+			if self._sent_time is not None:
+				self.response.update(now - self._sent_time)
+		else:
+			self._max_gap = max(self._max_gap, now - self._received_time)
+		self._received_time = now
+
+	def frame_received(self):
+		if self._max_gap > 0:
+			self.gap.update(self._max_gap)
+		self._reset()
+
+	def expired(self):
+		(self.response if self._received_time is None else self.gap).backoff()
+		self._reset()
+
+	def __str__(self):
+		return 'response: {}; gap: {}'.format(self.response, self.gap)
@@ -0,0 +1,156 @@
+#!/usr/bin/env python2
+# coding: utf-8
+
+import datetime
+
+from library import Mek61107, MeterClock, Obis, ObisDecoders
+
+# Профиль нагрузки активной энергии получасовой: 48 значений, W
+PROFILE_OBIS = Obis.ObisRange('63.01.00*[00..7F]')
+# Активная энергия за сутки по тарифам: T0-суммарный тариф, T1, T2, T3, T4, Wh
+DAY_TOTALS_OBIS = Obis.ObisRange('0F.80.80*[00..7F]')
+# Активная энергия на начало месяцев: T0-суммарный тариф, T1, T2, T3, T4, Wh
+MONTH_TOTALS_OBIS = Obis.ObisRange('0F.08.80*[00..0C]')
+MAX_DAYS_AGO = 127
+MAX_MONTHS_AGO = 12
+
+
+class ArchiveSync:
+	"""Инкрементальная синхронизация архивов счётчика (63.01.00 и 0F.80.80) с локальным архивом:
+	считываются только сутки после последних полностью считанных (watermark) и текущие сутки;
+	прошедшие сутки не изменяются. Смена даты счётчика во время синхронизации учитывается.
+
+	Example:
+	sync = Archive.ArchiveSync(ColumnStore.ColumnStore('archive'), meter_id, session.read, session.clock())
+	sync.sync(depth=127)
+	profile, totals = sync.store.load(meter_id, sync.clock.date(), 3)
+	"""
+
+	DAY_READ_DURATION = 10.  # seconds, reading of the day profile & the day totals
+	CHECKPOINT_DAYS = 8  # read days stored & flushed at once
+
+	def __init__(self, store, meter, read, clock=None):
+		"""store -- ColumnStore.ColumnStore
+		meter -- meter key in the store, e.g. ID (60.01.00*FF)
+		read -- function(obis) returns OBIS value text, e.g. Session.read
+		clock -- MeterClock.MeterClock, None - created with read"""
+		self.store = store
+		self.meter = meter
+		self.read = read
+		self.clock = MeterClock.MeterClock(read) if clock is None else clock
+		self.requests = 0
+		self.read_dates = []  # dates read by the last resume()
+
+	def fetch_day(self, date):
+		"""Returns (profile, totals) of date read from the meter"""
+		days_ago = (self.clock.date(self.DAY_READ_DURATION) - date).days
+		if not 0 <= days_ago <= MAX_DAYS_AGO:
+			raise ValueError('days_ago out of range (0..{}): {}'.format(MAX_DAYS_AGO, days_ago))
+		totals_obis = DAY_TOTALS_OBIS[days_ago]
+		profile_obis = PROFILE_OBIS[days_ago]
+		totals = ObisDecoders.decode(totals_obis, self.read(totals_obis))
+		profile = ObisDecoders.decode(profile_obis, self.read(profile_obis))
+		self.requests += 2
+		return profile, totals
+
+	def sync(self, depth=MAX_DAYS_AGO, today=True):
+		"""Reads the days not in the archive: after watermark but not earlier than depth days ago,
+		and the current (partial) day if today; returns list of read dates"""
+		first = self.clock.date(self.DAY_READ_DURATION) - datetime.timedelta(days=min(depth, MAX_DAYS_AGO))
+		watermark = self.store.watermark(self.meter)
+		date = first if watermark is None else max(first, watermark + datetime.timedelta(days=1))
+		watermark = date - datetime.timedelta(days=1)
+		ret = []
+		days = []  # read days not stored yet
+		try:
+			# the meter date is checked every day: the day finished during sync is read as complete
+			while date < self.clock.date(self.DAY_READ_DURATION):
+				days.append((date,) + self.fetch_day(date) + (True,))
+				ret.append(date)
+				if len(days) >= self.CHECKPOINT_DAYS:
+					watermark = self._store_days(days, watermark)
+				date += datetime.timedelta(days=1)
+			if today:
+				days.append((date,) + self.fetch_day(date) + (False,))
+				ret.append(date)
+		except Exception:
+			self._store_days(days, watermark)  # the days read before the error are kept
+			raise
+		self._store_days(days, watermark)
+		return ret
+
+	def _store_days(self, days, watermark):
+		"""Stores read days [(date, profile, totals, complete)] at once & clears the list; then moves
+		the watermark over the complete days following it; returns the watermark"""
+		days[:], stored = [], list(days)
+		self.store.put_days(self.meter, stored)
+		date = watermark
+		while self.store.is_complete(self.meter, date + datetime.timedelta(days=1)):
+			date += datetime.timedelta(days=1)
+		if date != watermark:
+			self.store.set_watermark(self.meter, date)
+		return date
+
+	def backfill(self, depth=MAX_DAYS_AGO, today=True):
+		"""Reads all days of depth days ago not complete in the archive, oldest first, and the current
+		day if today; read days are stored by CHECKPOINT_DAYS and before an error is raised,
+		so after an interruption the next backfill continues from the first missing day;
+		returns list of read dates"""
+		first = self.clock.date(self.DAY_READ_DURATION) - datetime.timedelta(days=min(depth, MAX_DAYS_AGO))
+		watermark = self.store.watermark(self.meter)
+		if watermark is None or watermark < first - datetime.timedelta(days=1):
+			watermark = first - datetime.timedelta(days=1)  # days before first are not read
+		ret = []
+		days = []  # read days not stored yet
+		date = first
+		try:
+			while date < self.clock.date(self.DAY_READ_DURATION):
+				if not self.store.is_complete(self.meter, date):
+					days.append((date,) + self.fetch_day(date) + (True,))
+					ret.append(date)
+					self.read_dates.append(date)
+					if len(days) >= self.CHECKPOINT_DAYS:
+						watermark = self._store_days(days, watermark)
+				date += datetime.timedelta(days=1)
+			if today:
+				days.append((date,) + self.fetch_day(date) + (False,))
+				ret.append(date)
+				self.read_dates.append(date)
+		except Exception:
+			self._store_days(days, watermark)  # the days read before the error are kept
+			raise
+		self._store_days(days, watermark)
+		return ret
+
+	def resume(self, depth=MAX_DAYS_AGO, reconnect=None, retries=3, today=True,
+			errors=(OSError, Mek61107.Mek61107.Mek61107Exception)):
+		"""Backfill that survives link errors: after an error reconnect() is called and the backfill
+		continues from the first missing day, the days already read are not read again;
+		returns list of read dates
+		errors -- exception types of a failed read, other exceptions are raised at once;
+			Session.read & read_obis of test_serial.py raise Session.SessionError (Mek61107Exception)"""
+		self.read_dates = []
+		for retry in range(retries + 1):
+			try:
+				self.backfill(depth, today)
+				return self.read_dates
+			except errors:
+				if retry >= retries or reconnect is None:
+					raise
+				reconnect()
+
+	def sync_months(self, depth=MAX_MONTHS_AGO):
+		"""Reads energies at the start of months (0F.08.80) of depth months ago not in the archive;
+		the month start values are not changed; returns list of read months first dates"""
+		date = self.clock.date()
+		month = datetime.date(date.year, date.month, 1)
+		ret = []
+		for months_ago in range(min(depth, MAX_MONTHS_AGO), -1, -1):
+			index = month.year * 12 + month.month - 1 - months_ago
+			month_date = datetime.date(index // 12, index % 12 + 1, 1)
+			if self.store.get_month(self.meter, month_date) is None:
+				obis = MONTH_TOTALS_OBIS[months_ago]
+				self.store.put_month(self.meter, month_date, ObisDecoders.decode(obis, self.read(obis)))
+				self.requests += 1
+				ret.append(month_date)
+		return ret
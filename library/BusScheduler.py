@@ -0,0 +1,147 @@
+#!/usr/bin/env python2
+# coding: utf-8
+
+import logging
+import time
+
+from library import Mek61107, NevaMt3xx, Session
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class MeterTiming:
+	"""Статистика времени опроса счётчика на шине, секунды"""
+
+	__slots__ = ('address', 'polls', 'errors', 'handshake_time', 'exchange_time', 'total_time', 'last_time', 'last_error')
+
+	def __init__(self, address):
+		self.address = address
+		self.polls = 0
+		self.errors = 0
+		self.handshake_time = 0.  # connect & login
+		self.exchange_time = 0.  # poll requests
+		self.total_time = 0.  # handshake, poll requests & logout
+		self.last_time = 0.
+		self.last_error = None
+
+	def mean_time(self):
+		return self.total_time / self.polls if self.polls else 0.
+
+	def __str__(self):
+		polls = max(self.polls, 1)
+		return '{}: polls {}, errors {}, handshake {:.3f} s, exchange {:.3f} s, total {:.3f} s'.format(
+			self.address or "''", self.polls, self.errors,
+			self.handshake_time / polls, self.exchange_time / polls, self.total_time / polls)
+
+
+class BusReport:
+	"""Отчёт о времени опроса шины"""
+
+	def __init__(self, meters):
+		self.meters = {meter.address: MeterTiming(meter.address) for meter in meters}
+		self.cycles = 0
+		self.cycle_time = 0.  # sum of cycles time
+
+	def mean_cycle_time(self):
+		return self.cycle_time / self.cycles if self.cycles else 0.
+
+	def capacity(self, period):
+		"""Returns estimated count of meters polled during period seconds"""
+		times = [timing.mean_time() for timing in self.meters.values() if timing.polls]
+		if not times:
+			return 0
+		return int(period / (sum(times) / len(times)))
+
+	def __str__(self):
+		lines = ['cycles {}, mean cycle {:.3f} s'.format(self.cycles, self.mean_cycle_time())]
+		lines += ['\t' + str(timing) for timing in self.meters.values()]
+		return '\n'.join(lines)
+
+
+class BusScheduler:
+	"""Опрос нескольких счётчиков на одной шине RS485 (один последовательный порт или
+	подключение конвертера) подряд по адресам: /?address!; порт не переоткрывается,
+	повторная команда B0 при завершении сеанса не посылается.
+
+	Example:
+	from library import BusScheduler, MeterRegistry, NevaMt3xx
+	def poll(session, meter):
+		return session.read('10.07.00*FF')  # Активная мощность
+	bus = BusScheduler.BusScheduler(NevaMt3xx.NevaMt3xx_com(port),
+		[MeterRegistry.Meter('9144'), MeterRegistry.Meter('9145')], poll)
+	print(bus.run_cycle())
+	print(bus.report)
+	print(bus.report.capacity(60))
+	"""
+
+	def __init__(self, protocol, meters, poll, logout_pause=None):
+		"""protocol -- NevaMt3xx_com or NevaMt3xx_tcp of the bus
+		meters -- list of MeterRegistry.Meter
+		poll -- function(session, meter) returns meter poll result
+		logout_pause -- see NevaMt3xx.logout"""
+		self.protocol = protocol
+		self.meters = list(meters)
+		self.poll = poll
+		self.logout_pause = logout_pause
+		self.report = BusReport(self.meters)
+
+	def poll_meter(self, meter):
+		"""Returns poll result of the meter or raises exception"""
+		timing = self.report.meters.setdefault(meter.address, MeterTiming(meter.address))
+		session = Session.Session(self.protocol, meter.password, address=meter.address, retries=0,
+			logout_pause=self.logout_pause)
+		start_time = time.monotonic()
+		try:
+			session.open()
+			handshake_time = time.monotonic()
+			ret = self.poll(session, meter)
+			exchange_time = time.monotonic()
+			session.close()
+		except Exception as e:
+			timing.errors += 1
+			timing.last_error = e
+			try:
+				# break the meter session to free the bus
+				self.protocol.send(NevaMt3xx.NevaMt3xx.Command('B0', ''))
+			except OSError:
+				pass
+			raise
+		finally:
+			timing.last_time = time.monotonic() - start_time
+		timing.polls += 1
+		timing.handshake_time += handshake_time - start_time
+		timing.exchange_time += exchange_time - handshake_time
+		timing.total_time += timing.last_time
+		return ret
+
+	def run_cycle(self):
+		"""Polls all meters back-to-back; returns dict {address: result or exception};
+		an exception of a meter does not stop the cycle"""
+		start_time = time.monotonic()
+		ret = {}
+		for meter in self.meters:
+			try:
+				ret[meter.address] = self.poll_meter(meter)
+			except (OSError, Mek61107.Mek61107.Mek61107Exception) as e:
+				_LOGGER.warning('Meter %r exchange error: %s', meter.address, e)
+				ret[meter.address] = e
+			except Exception as e:
+				# error of the poll function: the other meters of the bus are polled anyway
+				_LOGGER.exception('Meter %r poll error', meter.address)
+				ret[meter.address] = e
+		self.report.cycles += 1
+		self.report.cycle_time += time.monotonic() - start_time
+		return ret
+
+	def run(self, period=None, cycles=None, on_cycle=None):
+		"""Polls the bus cycles times (None - forever) every period seconds (None - continuously)
+		on_cycle -- function(results) called after every cycle"""
+		cycle = 0
+		while cycles is None or cycle < cycles:
+			start_time = time.monotonic()
+			results = self.run_cycle()
+			if on_cycle is not None:
+				on_cycle(results)
+			cycle += 1
+			if period is not None:
+				time.sleep(max(0., period - (time.monotonic() - start_time)))
@@ -0,0 +1,360 @@
+#!/usr/bin/env python2
+# coding: utf-8
+
+from array import array
+import datetime
+import json
+import logging
+import mmap
+import os
+import struct
+
+from library import HalfHours
+
+_LOGGER = logging.getLogger(__name__)
+
+MISSING, PARTIAL, COMPLETE = 0, 1, 2  # record flag
+
+# magic, typecode, width, first index, records count, mark index
+_HEADER = struct.Struct('<8sc3xiiii4x')
+_NO_MARK = -1
+
+
+class Column:
+	"""Колонка: файл записей фиксированной длины (width значений typecode и флаг записи),
+	отображённый в память. Запись index хранится по смещению (index - first) * размер записи,
+	поэтому запись и чтение -- O(1), а выборка диапазона -- срез memoryview без копирования.
+	Файл растёт удвоением; выданные срезы остаются действительными после роста. Запись до
+	начала колонки переписывает файл со сдвигом (атомарная замена); выданные ранее срезы
+	после этого недействительны."""
+
+	MAGIC = b'NEVACOL1'
+	GROW = 64  # records
+
+	def __init__(self, path, typecode, width, first=None):
+		"""first -- index of the first record of a new file; None - open existing file only"""
+		self.path = path
+		self.typecode = typecode
+		self.width = width
+		self.itemsize = array(typecode).itemsize
+		self.record_size = (width + 1) * self.itemsize
+		if os.path.exists(path):
+			self.file = open(path, 'r+b')
+			magic, file_typecode, file_width, self.first, self.count, self.mark = \
+				_HEADER.unpack(self.file.read(_HEADER.size))
+			if magic != self.MAGIC or file_typecode.decode() != typecode or file_width != width:
+				self.file.close()
+				raise ValueError('Wrong column file: ' + path)
+		elif first is None:
+			raise FileNotFoundError(path)
+		else:
+			os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+			self.file = open(path, 'w+b')
+			self.first, self.count, self.mark = first, 0, _NO_MARK
+			self.file.truncate(_HEADER.size + self.GROW * self.record_size)
+			_fsync_directory(path)
+		self.mm = mmap.mmap(self.file.fileno(), 0)
+		self._write_header()
+
+	def _write_header(self):
+		_HEADER.pack_into(self.mm, 0, self.MAGIC, self.typecode.encode(), self.width, self.first, self.count, self.mark)
+
+	def capacity(self):
+		return (len(self.mm) - _HEADER.size) // self.record_size
+
+	def _grow(self, count):
+		self.file.truncate(_HEADER.size + max(count, 2 * self.capacity()) * self.record_size)
+		mm, self.mm = self.mm, mmap.mmap(self.file.fileno(), 0)
+		try:
+			mm.close()
+		except BufferError:
+			# exported slices keep the old mapping: it is unmapped with the last of them
+			_LOGGER.warning('%s: old mapping is in use by exported slices', self.path)
+
+	def _prepend(self, first):
+		"""Moves the records to start from index first: the file is rewritten & replaced atomically"""
+		shift = self.first - first
+		path = self.path + '.tmp'
+		with open(path, 'wb') as f:
+			f.write(_HEADER.pack(self.MAGIC, self.typecode.encode(), self.width, first, self.count + shift, self.mark))
+			f.write(bytes(shift * self.record_size))
+			f.write(self.mm[_HEADER.size:_HEADER.size + self.count * self.record_size])
+			f.flush()
+			os.fsync(f.fileno())
+		self.close()
+		os.replace(path, self.path)
+		_fsync_directory(self.path)
+		self.file = open(self.path, 'r+b')
+		self.mm = mmap.mmap(self.file.fileno(), 0)
+		self.first = first
+		self.count += shift
+
+	def __len__(self):
+		return self.count
+
+	def put(self, index, values, flag=COMPLETE):
+		"""Writes record; the record before the column start moves the start to index - GROW"""
+		if index < self.first:
+			self._prepend(index - self.GROW)
+		i = index - self.first
+		record = array(self.typecode, values)
+		if len(record) != self.width:
+			raise ValueError('{} values expected: {}'.format(self.width, len(record)))
+		record.append(flag)
+		if i >= self.capacity():
+			self._grow(i + 1)
+		offset = _HEADER.size + i * self.record_size
+		self.mm[offset:offset + self.record_size] = record.tobytes()
+		if i >= self.count:
+			self.count = i + 1
+			self._write_header()
+
+	def set_flag(self, index, flag):
+		"""Changes flag of the stored record"""
+		i = index - self.first
+		if not 0 <= i < self.count:
+			raise IndexError('Index {} is not stored: {}'.format(index, self.path))
+		offset = _HEADER.size + i * self.record_size + self.width * self.itemsize
+		self.mm[offset:offset + self.itemsize] = array(self.typecode, (flag,)).tobytes()
+
+	def get(self, index):
+		"""Returns (memoryview of values, flag) or None - missing"""
+		i = index - self.first
+		if not 0 <= i < self.count:
+			return None
+		offset = _HEADER.size + i * self.record_size
+		record = memoryview(self.mm)[offset:offset + self.record_size].cast(self.typecode)
+		if record[self.width] == MISSING:
+			return None
+		return record[:self.width], record[self.width]
+
+	def rows(self, first, last):
+		"""Returns memoryview [rows, width + 1] of records first..last (inclusive, clipped to the stored):
+		values & flag; without copying"""
+		begin = max(first - self.first, 0)
+		end = min(last - self.first + 1, self.count)
+		if end <= begin:
+			return memoryview(array(self.typecode))  # no rows
+		return memoryview(self.mm)[_HEADER.size + begin * self.record_size:_HEADER.size + end * self.record_size] \
+			.cast(self.typecode, shape=[end - begin, self.width + 1])
+
+	def set_mark(self, index):
+		self.mark = index
+		self._write_header()
+
+	def get_mark(self):
+		return None if self.mark == _NO_MARK else self.mark
+
+	def flush(self):
+		"""Writes changed pages & the file size to the disk (durable checkpoint)"""
+		self.mm.flush()
+		os.fsync(self.file.fileno())
+
+	def close(self):
+		try:
+			self.mm.close()
+		except BufferError:
+			_LOGGER.warning('%s: closed mapping is in use by exported slices', self.path)
+		self.file.close()
+
+
+def _fsync_directory(path):
+	"""Makes creation or replacement of the file path durable"""
+	if os.name == 'nt':
+		return  # directories can't be opened
+	fd = os.open(os.path.dirname(path) or '.', os.O_RDONLY)
+	try:
+		os.fsync(fd)
+	finally:
+		os.close(fd)
+
+
+class ColumnStore:
+	"""Хранилище архивов счётчиков без сервера БД: каталог path/<meter>/ с колонками
+	<OBIS>.col на счётчик и OBIS код -- получасовой профиль (630100, по суткам, 48 x int32, W),
+	энергии за сутки (0F8080, по суткам, 5 x int64, Wh) и на начало месяцев (0F0880, по месяцам,
+	5 x int64, Wh). Сохранённые записи сбрасываются на диск (контрольная точка); сутки
+	записываются пакетом в две колонки в два этапа, поэтому после сбоя они либо целиком
+	прежние/новые, либо отсутствуют. Интерфейс суток совпадает с требуемым Archive.ArchiveSync.
+	Архив прежнего формата (path/<meter>/ГГГГ-ММ-ДД.json и watermark) переносится в колонки
+	при первом обращении к счётчику, файлы JSON перемещаются в path/<meter>/json/.
+
+	Example:
+	store = ColumnStore.ColumnStore('archive')
+	profile = store.days(meter_id, store.PROFILE, date(2024, 1, 1), date(2024, 1, 31))  # [31, 49]
+	print(profile[0, 47], profile[0, 48] == ColumnStore.COMPLETE)
+	"""
+
+	PROFILE = '630100'
+	DAY_TOTALS = '0F8080'
+	MONTH_TOTALS = '0F0880'
+	# typecode, width, records reserved before the first record (archive depth)
+	KINDS = {
+		PROFILE: ('i', HalfHours.HALF_HOURS, 128),
+		DAY_TOTALS: ('q', HalfHours.TARIFFS, 128),
+		MONTH_TOTALS: ('q', HalfHours.TARIFFS, 13),
+	}
+
+	JSON_DIRECTORY = 'json'  # migrated JSON archive files
+
+	def __init__(self, path):
+		self.path = path
+		self.columns = {}  # (meter, kind): Column
+		self.migrated = set()  # meters checked for JSON archive
+
+	def _meter_path(self, meter):
+		return os.path.join(self.path, str(meter).replace(os.sep, '_') or '_')
+
+	def column(self, meter, kind, index=None):
+		"""Returns Column of meter kind; creates it for the first record index; None - not exists"""
+		if meter not in self.migrated:
+			self.migrated.add(meter)
+			self.migrate_json(meter)
+		key = (meter, kind)
+		column = self.columns.get(key)
+		if column is None:
+			typecode, width, reserve = self.KINDS[kind]
+			path = os.path.join(self._meter_path(meter), kind + '.col')
+			try:
+				column = Column(path, typecode, width, None if index is None else index - reserve)
+			except FileNotFoundError:
+				return None
+			self.columns[key] = column
+		return column
+
+	def close(self):
+		for column in self.columns.values():
+			column.close()
+		self.columns.clear()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.close()
+
+	@staticmethod
+	def month_index(date):
+		return date.year * 12 + date.month - 1
+
+	def migrate_json(self, meter):
+		"""Moves days & watermark of the JSON archive of the meter (former Archive.ArchiveStore) into the columns;
+		returns count of moved days"""
+		directory = self._meter_path(meter)
+		try:
+			names = sorted(name for name in os.listdir(directory) if len(name) == 15 and name.endswith('.json'))  # ГГГГ-ММ-ДД.json
+		except FileNotFoundError:
+			return 0
+		if not names and not os.path.isfile(os.path.join(directory, 'watermark')):
+			return 0
+		days = []
+		for name in names:
+			with open(os.path.join(directory, name)) as f:
+				day = json.load(f)
+			days.append((datetime.date.fromisoformat(name[:-5]), day['profile'], day['totals'], day['complete']))
+		self.put_days(meter, days)
+		names.append('watermark')
+		try:
+			with open(os.path.join(directory, 'watermark')) as f:
+				self.set_watermark(meter, datetime.date.fromisoformat(f.read().strip()))
+		except FileNotFoundError:
+			names.pop()
+		os.makedirs(os.path.join(directory, self.JSON_DIRECTORY), exist_ok=True)
+		for name in names:
+			os.replace(os.path.join(directory, name), os.path.join(directory, self.JSON_DIRECTORY, name))
+		return len(names)
+
+	def put_day(self, meter, date, profile, totals, complete=True):
+		"""Stores the day durably & atomically, see put_days"""
+		self.put_days(meter, [(date, profile, totals, complete)])
+
+	def put_days(self, meter, days):
+		"""Stores days [(date, profile, totals, complete)] durably & atomically per day: the records are
+		written as missing & flushed, then the flags are set & flushed, so after a crash every day is
+		missing or consistent; the columns are flushed twice per call, not per day"""
+		if not days:
+			return
+		first = min(date for date, profile, totals, complete in days).toordinal()
+		columns = [self.column(meter, kind, first) for kind in (self.DAY_TOTALS, self.PROFILE)]
+		for date, profile, totals, complete in days:
+			for column, values in zip(columns, (totals, profile)):
+				column.put(date.toordinal(), values, MISSING)
+		for column in columns:
+			column.flush()
+		for date, profile, totals, complete in days:
+			for column in columns:
+				column.set_flag(date.toordinal(), COMPLETE if complete else PARTIAL)
+		for column in columns:
+			column.flush()
+
+	def get_day(self, meter, date):
+		"""Returns (profile tuple, totals tuple, complete) or None"""
+		index = date.toordinal()
+		profile = self.column(meter, self.PROFILE)
+		totals = self.column(meter, self.DAY_TOTALS)
+		profile = None if profile is None else profile.get(index)
+		totals = None if totals is None else totals.get(index)
+		if profile is None or totals is None:
+			return None
+		return tuple(profile[0]), tuple(totals[0]), profile[1] == COMPLETE and totals[1] == COMPLETE
+
+	def is_complete(self, meter, date):
+		day = self.get_day(meter, date)
+		return day is not None and day[2]
+
+	def watermark(self, meter):
+		"""Returns date of the last complete day: all days since the first sync till it are in the store;
+		None - empty"""
+		column = self.column(meter, self.PROFILE)
+		mark = None if column is None else column.get_mark()
+		return None if mark is None else datetime.date.fromordinal(mark)
+
+	def set_watermark(self, meter, date):
+		column = self.column(meter, self.PROFILE, date.toordinal())
+		column.set_mark(date.toordinal())
+		column.flush()
+
+	def days(self, meter, kind, first_date, last_date):
+		"""Returns memoryview [days, width + 1] of stored days first_date..last_date of PROFILE or DAY_TOTALS:
+		values & flag; without copying"""
+		column = self.column(meter, kind)
+		if column is None:
+			return memoryview(array(self.KINDS[kind][0]))  # no rows
+		return column.rows(first_date.toordinal(), last_date.toordinal())
+
+	def load(self, meter, last_date, days):
+		"""Returns (HalfHours.HalfHourProfile, list of day totals) of days from last_date backwards;
+		raises KeyError if a day is not in the store"""
+		first_date = last_date - datetime.timedelta(days=days - 1)
+		profile_rows = self.days(meter, self.PROFILE, first_date, last_date)
+		totals_rows = self.days(meter, self.DAY_TOTALS, first_date, last_date)
+		profile = HalfHours.HalfHourProfile(last_date)
+		totals = []
+		if len(profile_rows) == days and len(totals_rows) == days:
+			for profile_row, totals_row in zip(reversed(profile_rows.tolist()), reversed(totals_rows.tolist())):
+				if profile_row[-1] == MISSING or totals_row[-1] == MISSING:
+					break
+				profile.append(profile_row[:-1])
+				totals.append(tuple(totals_row[:-1]))
+		if len(profile) != days:
+			raise KeyError('{}: {} is not in the store'.format(meter, last_date - datetime.timedelta(days=len(profile))))
+		return profile, totals
+
+	def put_month(self, meter, date, totals):
+		"""Stores energies [sum, T1, T2, T3, T4] at the start of month of date, Wh"""
+		index = self.month_index(date)
+		column = self.column(meter, self.MONTH_TOTALS, index)
+		column.put(index, totals)
+		column.flush()
+
+	def get_month(self, meter, date):
+		column = self.column(meter, self.MONTH_TOTALS)
+		month = None if column is None else column.get(self.month_index(date))
+		return None if month is None else tuple(month[0])
+
+	def months(self, meter, first_date, last_date):
+		"""Returns memoryview [months, 6] of stored months first_date..last_date: values & flag; without copying"""
+		column = self.column(meter, self.MONTH_TOTALS)
+		if column is None:
+			return memoryview(array('q'))  # no rows
+		return column.rows(self.month_index(first_date), self.month_index(last_date))
@@ -0,0 +1,164 @@
+#!/usr/bin/env python2
+# coding: utf-8
+
+import abc
+from array import array
+import csv
+import datetime
+import json
+import struct
+
+from library import HalfHours
+
+PROFILE_COLUMNS = ('power_w',)  # half hour profile, W
+TARIFF_COLUMNS = ('sum_wh', 't1_wh', 't2_wh', 't3_wh', 't4_wh')  # cumulative energies by tariffs, Wh
+
+
+def profile_rows(profile):
+	"""Yields rows (datetime, W) of HalfHours.HalfHourProfile from the oldest day"""
+	for i in range(len(profile) - 1, -1, -1):
+		day = profile[i]
+		for half_hour in range(HalfHours.HALF_HOURS):
+			yield profile.datetime(i, half_hour), day[half_hour]
+
+
+def tariff_rows(totals):
+	"""Yields rows (datetime, sum, T1, T2, T3, T4) of HalfHours.TariffTotals window from the oldest day"""
+	for i in range(len(totals) - 1, -1, -1):
+		first = totals.first if i == 0 else 0
+		last = totals.last if i == len(totals) - 1 else HalfHours.HALF_HOURS - 1
+		day = totals[i]
+		for half_hour in range(first, last + 1):
+			index = half_hour * HalfHours.TARIFFS
+			yield (totals.datetime(i, half_hour),) + tuple(day[index:index + HalfHours.TARIFFS])
+
+
+class Exporter(abc.ABC):
+	"""Потоковая выгрузка строк (datetime, значения...) счётчиков: строки записываются по мере
+	поступления (или пачками), вся таблица в памяти не строится.
+
+	Example:
+	with Exporters.make_exporter('csv', sys.stdout, Exporters.TARIFF_COLUMNS) as exporter:
+		exporter.write(meter_id, Exporters.tariff_rows(totals))
+	"""
+
+	def __init__(self, stream, columns):
+		"""stream -- text stream; binary stream for ColumnarExporter
+		columns -- names of values columns"""
+		self.stream = stream
+		self.columns = tuple(columns)
+		self.rows = 0
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.close()
+
+	@abc.abstractmethod
+	def write(self, meter, rows):
+		"""rows -- iterable of (datetime, value, ...)"""
+
+	def close(self):
+		self.stream.flush()
+
+
+class CsvExporter(Exporter):
+	"""CSV: meter,datetime,<columns>"""
+
+	def __init__(self, stream, columns, delimiter=','):
+		super().__init__(stream, columns)
+		self.writer = csv.writer(stream, delimiter=delimiter, lineterminator='\n')
+		self.writer.writerow(('meter', 'datetime') + self.columns)
+
+	def write(self, meter, rows):
+		for row in rows:
+			self.writer.writerow((meter, row[0].isoformat(' ', 'minutes')) + tuple(row[1:]))
+			self.rows += 1
+
+
+class JsonLinesExporter(Exporter):
+	"""JSON Lines: {"meter": ..., "datetime": ..., <column>: value, ...}"""
+
+	def write(self, meter, rows):
+		keys = ('datetime',) + self.columns
+		for row in rows:
+			item = dict(zip(keys, (row[0].isoformat(' ', 'minutes'),) + tuple(row[1:])))
+			item['meter'] = meter
+			self.stream.write(json.dumps(item) + '\n')
+			self.rows += 1
+
+
+class ColumnarExporter(Exporter):
+	"""Компактный двоичный поколоночный формат (little-endian):
+	заголовок: MAGIC, длина (uint32) и JSON список имён колонок значений;
+	пачки по batch_size строк: BATCH, количество строк (uint32), длина (uint16) и имя счётчика utf-8,
+	колонка времени (int64, секунды от 1970-01-01 по местному времени без пояса), колонки значений (int64)"""
+
+	MAGIC = b'NEVACLM1'
+	BATCH = b'B'
+	_HEADER = struct.Struct('<I')
+	_BATCH_HEADER = struct.Struct('<cIH')
+	_EPOCH = datetime.datetime(1970, 1, 1)
+
+	def __init__(self, stream, columns, batch_size=4096):
+		super().__init__(stream, columns)
+		self.batch_size = batch_size
+		names = json.dumps(list(self.columns)).encode()
+		stream.write(self.MAGIC + self._HEADER.pack(len(names)) + names)
+
+	def _write_batch(self, meter, times, values):
+		meter = str(meter).encode()
+		self.stream.write(self._BATCH_HEADER.pack(self.BATCH, len(times), len(meter)) + meter)
+		self.stream.write(times.tobytes())
+		for column in values:
+			self.stream.write(column.tobytes())
+		self.rows += len(times)
+
+	def write(self, meter, rows):
+		times = array('q')
+		values = [array('q') for _ in self.columns]
+		for row in rows:
+			times.append(int((row[0] - self._EPOCH).total_seconds()))
+			for column, value in zip(values, row[1:]):
+				column.append(value)
+			if len(times) >= self.batch_size:
+				self._write_batch(meter, times, values)
+				times = array('q')
+				values = [array('q') for _ in self.columns]
+		if times:
+			self._write_batch(meter, times, values)
+
+	@classmethod
+	def read(cls, stream):
+		"""Yields batches (meter, columns names, datetimes array('q') seconds, list of values arrays)"""
+		if stream.read(len(cls.MAGIC)) != cls.MAGIC:
+			raise ValueError('Wrong columnar file')
+		size, = cls._HEADER.unpack(stream.read(cls._HEADER.size))
+		columns = tuple(json.loads(stream.read(size).decode()))
+		while True:
+			header = stream.read(cls._BATCH_HEADER.size)
+			if not header:
+				return
+			batch, rows, size = cls._BATCH_HEADER.unpack(header)
+			if batch != cls.BATCH:
+				raise ValueError('Wrong columnar batch')
+			meter = stream.read(size).decode()
+			arrays = []
+			for _ in range(len(columns) + 1):
+				column = array('q')
+				column.frombytes(stream.read(rows * column.itemsize))
+				arrays.append(column)
+			yield meter, columns, arrays[0], arrays[1:]
+
+
+FORMATS = {
+	'csv': CsvExporter,
+	'jsonl': JsonLinesExporter,
+	'columnar': ColumnarExporter,
+}
+
+
+def make_exporter(format, stream, columns):
+	"""format -- 'csv', 'jsonl' or 'columnar' (binary stream)"""
+	return FORMATS[format](stream, columns)
@@ -0,0 +1,116 @@
+#!/usr/bin/env python2
+# coding: utf-8
+
+from array import array
+import datetime
+
+HALF_HOURS = 48  # получасов в сутках
+TARIFFS = 5  # сумма по тарифам, T1, T2, T3, T4
+
+
+class _Days:
+	"""Матрица days x width целых в одном непрерывном array; строка i -- сутки base_date - i дней
+	(как days_ago в OBIS кодах архивов), даты и время вычисляются по запросу"""
+
+	__slots__ = ('base_date', 'values')
+
+	TYPECODE = 'i'
+	WIDTH = HALF_HOURS
+
+	def __init__(self, base_date, values=None):
+		"""base_date -- datetime.date of the row 0
+		values -- iterable of days x WIDTH values"""
+		if isinstance(base_date, datetime.datetime):
+			base_date = base_date.date()
+		self.base_date = base_date
+		self.values = array(self.TYPECODE, () if values is None else values)
+		if len(self.values) % self.WIDTH:
+			raise ValueError('Values count is not multiple of {}: {}'.format(self.WIDTH, len(self.values)))
+
+	def __len__(self):
+		return len(self.values) // self.WIDTH
+
+	def _index(self, i):
+		if i < 0:
+			i += len(self)
+		if not 0 <= i < len(self):
+			raise IndexError(i)
+		return i * self.WIDTH
+
+	def __getitem__(self, i):
+		"""Returns array of day i values"""
+		index = self._index(i)
+		return self.values[index:index + self.WIDTH]
+
+	def __iter__(self):
+		for index in range(0, len(self.values), self.WIDTH):
+			yield self.values[index:index + self.WIDTH]
+
+	def append(self, day):
+		"""Adds the next (previous date) day of WIDTH values"""
+		size = len(self.values)
+		self.values.extend(day)
+		if len(self.values) - size != self.WIDTH:
+			del self.values[size:]
+			raise ValueError('{} values of day expected'.format(self.WIDTH))
+
+	def date(self, i):
+		return self.base_date - datetime.timedelta(days=i)
+
+	def datetime(self, i, half_hour):
+		"""Returns start datetime of half hour 0..47 of day i"""
+		date = self.date(i)
+		return datetime.datetime(date.year, date.month, date.day, half_hour // 2, half_hour % 2 * 30)
+
+	@property
+	def nbytes(self):
+		return len(self.values) * self.values.itemsize
+
+
+class HalfHourProfile(_Days):
+	"""Получасовые профили (63.01.00*ДД): days x 48 значений, W.
+
+	Example:
+	profile = HalfHours.HalfHourProfile(datetime.date.today())
+	for days_ago in range(3):
+		profile.append(read_half_hours(days_ago))
+	print(profile.date(2), profile[2][47])
+	"""
+
+	__slots__ = ()
+
+	def day_sums(self):
+		"""Returns array of days sums of half hour values"""
+		return array('q', (sum(day) for day in self))
+
+
+class TariffTotals(_Days):
+	"""Нарастающие итоги энергии по тарифам на конец каждого получаса: days x 48 x 5
+	[сумма, T1, T2, T3, T4], Wh. first -- первый получас строки 0, last -- последний получас
+	последней строки (окно запрошенного периода)."""
+
+	__slots__ = ('first', 'last')
+
+	TYPECODE = 'q'
+	WIDTH = HALF_HOURS * TARIFFS
+
+	def __init__(self, base_date, values=None, first=0, last=HALF_HOURS - 1):
+		super().__init__(base_date, values)
+		self.first = first
+		self.last = last
+
+	def total(self, i, half_hour):
+		"""Returns array [sum, T1, T2, T3, T4] of day i half hour 0..47"""
+		index = self._index(i) + half_hour * TARIFFS
+		return self.values[index:index + TARIFFS]
+
+	def rows(self, i):
+		"""Returns list of day i half hours in the window: [datetime, sum, T1, T2, T3, T4]"""
+		first = self.first if i == 0 else 0
+		last = self.last if i == len(self) - 1 else HALF_HOURS - 1
+		return [[self.datetime(i, half_hour)] + self.total(i, half_hour).tolist()
+			for half_hour in range(first, last + 1)]
+
+	def to_lists(self):
+		"""Returns list of days lists of half hours: [ [[datetime, sum, T1, T2, T3, T4]*48]*days ]"""
+		return [self.rows(i) for i in range(len(self))]
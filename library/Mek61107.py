@@ -1,6 +1,10 @@
 #!/usr/bin/env python2
 # coding: utf-8
 
+import abc
+import re
+from collections import OrderedDict
+
 
 class Mek61107:
     BAUDRATE_SYMBOLS = '012345'  # Кодирование скорости передачи информации в режиме C
@@ -38,16 +42,48 @@ class Mek61107:
             return 'Wrong ack message: ' + \
                 (self.buff.decode('latin').encode('unicode_escape') if len(self.buff) > 0 else '<no data>')
 
+    class Bcc(abc.ABC):
+        """Incremental BCC engine: update() by bytes/memoryview chunks as they arrive, digest() - BCC byte value.
+		Protocol dialect sets its engine class into BCC class attribute; successor implements update()"""
+
+        def __init__(self):
+            self.value = 0
+
+        def reset(self):
+            self.value = 0
+
+        @abc.abstractmethod
+        def update(self, data):
+            """Adds bytes-like data into BCC"""
+
+        def digest(self):
+            return self.value
+
+        @classmethod
+        def calculate(cls, buff):
+            """Returns BCC of str or bytes-like buff"""
+            bcc = cls()
+            bcc.update(buff.encode('latin') if isinstance(buff, str) else buff)
+            return bcc.digest()
+
+    class BccIso1155(Bcc):
+        """ISO 1155: sum of bytes modulo 128, two's complement"""
+
+        def update(self, data):
+            self.value = (self.value + sum(data)) & 0x7f
+
+        def digest(self):
+            return (self.value ^ 0xFF) + 1
+
+    BCC = BccIso1155
+
     def __init__(self, initial_baudrate=300):
         self.initial_baudrate = initial_baudrate
+        self.frames = self.make_frame_cache()
 
     @staticmethod
     def calculate_bcc_iso1155(buff):
-        ret = 0
-        for b in buff:
-            ret = (ret + ord(b)) & 0x7f
-        ret ^= 0xFF
-        return ret + 1
+        return Mek61107.BccIso1155.calculate(buff)
 
     @staticmethod
     def get_line(buff):
@@ -231,5 +267,260 @@ class Mek61107:
         return None
 
     def is_bcc_correct(self, buff, end_index, start_index=1):
-        """Successor can override this BCC calculation"""
-        return ord(buff[end_index + 1]) == self.calculate_bcc_iso1155(buff[start_index:end_index + 1])
+        """Successor can override this BCC calculation or set its BCC engine class"""
+        bcc = buff[end_index + 1]
+        return (ord(bcc) if isinstance(bcc, str) else bcc) == self.BCC.calculate(buff[start_index:end_index + 1])
+
+    def make_bcc(self):
+        """Returns new incremental BCC engine of the protocol for parsers"""
+        return self.BCC()
+
+    def make_frame_cache(self, maxsize=256):
+        """Returns new cache of serialized command frames bound to this protocol"""
+        return Mek61107.FrameCache(self, maxsize=maxsize)
+
+    def serialize_frame(self, cmd):
+        """Returns bytes of Ack, Nak, Message or Command; commands are taken from the frame cache"""
+        if cmd.is_command and not cmd.is_block:
+            return self.frames.get(cmd.command, cmd.data)
+        return cmd.serialize(calculate_bcc_func=self.BCC.calculate).encode('latin')
+
+    class FrameCache:
+        """Bounded LRU cache of serialized command frames: (command, data) -> bytes,
+		so repeated requests (e.g. R1 of polled OBIS codes) are sent without building the frame.
+
+		Example:
+		protocol.connection.sendall(protocol.frames.get('R1', '000902FF()'))
+		"""
+
+        def __init__(self, protocol, maxsize=256):
+            self.protocol = protocol
+            self.maxsize = maxsize
+            self.frames = OrderedDict()
+            self.hits = 0
+            self.misses = 0
+
+        def get(self, command, data=''):
+            key = (command, data)
+            frame = self.frames.get(key)
+            if frame is not None:
+                self.hits += 1
+                self.frames.move_to_end(key)
+                return frame
+            self.misses += 1
+            frame = bytearray(b'\x01')  # SOH
+            frame += command.encode('latin')
+            frame += b'\x02'  # STX
+            frame += data.encode('latin')
+            frame += b'\x03'  # ETX
+            bcc = self.protocol.make_bcc()
+            with memoryview(frame) as view, view[1:] as buff:
+                bcc.update(buff)
+            frame.append(bcc.digest())
+            frame = bytes(frame)
+            self.frames[key] = frame
+            if len(self.frames) > self.maxsize:
+                self.frames.popitem(last=False)
+            return frame
+
+        def clear(self):
+            self.frames.clear()
+
+        def __len__(self):
+            return len(self.frames)
+
+    def make_parser(self):
+        """Returns new incremental frame parser bound to this protocol"""
+        return Mek61107.FrameParser(self)
+
+    class FrameParser:
+        """Incremental parser of byte stream into frames: Ack, Nak, Message, Command.
+		Keeps scan position and running BCC between chunks, so every received byte
+		is processed once; bytes past the frame are kept for the next one.
+
+		Example:
+		parser = protocol.make_parser()
+		for cmd in parser.feed(connection.recv(512)):
+			print(cmd)
+		"""
+
+        FRAME_START_BYTES = b'\x01\x02\x06\x0F'  # SOH, STX, ACK, NAK
+
+        def __init__(self, protocol):
+            self.protocol = protocol
+            self.buff = bytearray()
+            self._bcc = protocol.make_bcc()
+            self._reset_frame()
+
+        def _reset_frame(self):
+            self._scan_index = 1  # next byte to scan for ETX/EOT & to add into BCC
+            self._end_index = -1  # ETX/EOT index; -1 - not found yet
+            self._bcc.reset()
+
+        def __len__(self):
+            """Returns count of buffered bytes"""
+            return len(self.buff)
+
+        def clear(self):
+            """Drops buffered bytes"""
+            del self.buff[:]
+            self._reset_frame()
+
+        def get_line(self, delimiter=b'\x0D\x0A'):
+            """Returns line without line delimiter taken from buffered bytes or None"""
+            endl_index = self.buff.find(delimiter)
+            if endl_index < 0:
+                return None
+            line = self.buff[:endl_index].decode('latin')
+            del self.buff[:endl_index + len(delimiter)]
+            self._reset_frame()
+            return line
+
+        def feed(self, chunk=b''):
+            """Appends bytes/memoryview chunk and returns generator of completed frames.
+			Generator may raise exceptions: WrongBcc, SohOrStxExpected;
+			wrong frame is dropped, so parsing can be continued by next feed()"""
+            if chunk:
+                self.buff += chunk
+            return self.frames()
+
+        def frames(self):
+            while True:
+                frame = self._next_frame()
+                if frame is None:
+                    return
+                yield frame
+
+        def _update_bcc(self, stop_index):
+            with memoryview(self.buff) as view, view[self._scan_index:stop_index] as data:
+                self._bcc.update(data)
+            self._scan_index = stop_index
+
+        def _next_frame(self):
+            buff = self.buff
+            if len(buff) == 0:
+                return None
+            start = buff[0]
+            if start == 0x06:
+                del buff[:1]
+                return Mek61107.Ack()
+            if start == 0x0F:
+                del buff[:1]
+                return Mek61107.Nak()
+            if start != 0x01 and start != 0x02:
+                # skip garbage up to next possible frame
+                index = 1
+                while index < len(buff) and buff[index] not in self.FRAME_START_BYTES:
+                    index += 1
+                del buff[:index]
+                raise Mek61107.SohOrStxExpected()
+            if self._end_index < 0:
+                # find ETX or EOT in the received bytes only
+                end_index = buff.find(b'\x03', self._scan_index)
+                eot_index = buff.find(b'\x04', self._scan_index, end_index if end_index >= 0 else len(buff))
+                if eot_index >= 0:
+                    end_index = eot_index
+                if end_index < 0:
+                    self._update_bcc(len(buff))
+                    return None
+                self._update_bcc(end_index + 1)
+                self._end_index = end_index
+            end_index = self._end_index
+            if len(buff) <= end_index + 1:
+                return None
+            # command or message received
+            is_bcc_correct = self._bcc.digest() == buff[end_index + 1]
+            if not is_bcc_correct:
+                frame = None
+            elif start == 0x01:
+                frame = Mek61107.Command(buff[1:3].decode('latin'), buff[4:end_index].decode('latin'))
+            else:
+                frame = Mek61107.Message(buff[1:end_index].decode('latin'))
+            del buff[:end_index + 2]
+            self._reset_frame()
+            if frame is None:
+                raise Mek61107.WrongBcc()
+            return frame
+
+    def make_readout_parser(self):
+        """Returns new incremental parser of data readout message bound to this protocol"""
+        return Mek61107.ReadoutParser(self)
+
+    class ReadoutParser:
+        """Incremental parser of data readout message (mode C, y='0'); п.5.3:
+		STX data_block ! CR LF ETX BCC
+		Yields data sets (address, value) while bytes are still arriving;
+		value is tuple for data set with several values: address(value1)(value2).
+
+		Example:
+		parser = protocol.make_readout_parser()
+		while not parser.is_finished:
+			for address, value in parser.feed(connection.recv(512)):
+				print(address, value)
+		"""
+
+        DATA_SET = re.compile(r'([^()]*)\(([^()]*)\)')
+
+        def __init__(self, protocol):
+            self.protocol = protocol
+            self.buff = bytearray()
+            self.is_started = False  # STX received
+            self.is_finished = False  # ETX & BCC received
+            self._bcc = protocol.make_bcc()
+
+        def feed(self, chunk=b''):
+            """Appends bytes/memoryview chunk and returns generator of (address, value).
+			Generator may raise exceptions: WrongBcc"""
+            if chunk and not self.is_finished:
+                self.buff += chunk
+            return self.data_sets()
+
+        def _update_bcc(self, stop_index):
+            with memoryview(self.buff) as view, view[:stop_index] as data:
+                self._bcc.update(data)
+
+        def data_sets(self):
+            buff = self.buff
+            if not self.is_started:
+                index = buff.find(b'\x02')  # STX
+                if index < 0:
+                    del buff[:]
+                    return
+                del buff[:index + 1]
+                self.is_started = True
+            while not self.is_finished and len(buff) > 0:
+                if buff[0] == 0x03:
+                    # ETX
+                    if len(buff) < 2:
+                        return
+                    self._update_bcc(1)
+                    is_bcc_correct = self._bcc.digest() == buff[1]
+                    del buff[:]
+                    self.is_finished = True
+                    if not is_bcc_correct:
+                        raise Mek61107.WrongBcc()
+                    return
+                end_index = buff.find(b'\x0D\x0A')
+                etx_index = buff.find(b'\x03', 0, end_index if end_index >= 0 else len(buff))
+                if etx_index >= 0:
+                    # last line without CR LF
+                    end_index, line_end_index = etx_index, etx_index
+                elif end_index >= 0:
+                    line_end_index = end_index + 2
+                else:
+                    return
+                line = buff[:end_index].decode('latin')
+                self._update_bcc(line_end_index)
+                del buff[:line_end_index]
+                address = ''
+                values = []
+                for data_set in self.DATA_SET.finditer(line):
+                    data_set_address = data_set.group(1).strip()
+                    if data_set_address:
+                        if values:
+                            yield address, values[0] if len(values) == 1 else tuple(values)
+                            values = []
+                        address = data_set_address
+                    values.append(data_set.group(2))
+                if values:
+                    yield address, values[0] if len(values) == 1 else tuple(values)
@@ -0,0 +1,87 @@
+#!/usr/bin/env python2
+# coding: utf-8
+
+import datetime
+import time
+
+from library import Mek61107, ObisDecoders
+
+DATE_OBIS = '00.09.02*FF'  # Дата: ГГММДД
+TIME_OBIS = '00.09.01*FF'  # Время: ЧЧММСС
+
+
+class MeterClock:
+	"""Модель часов счётчика: дата и время считываются один раз, далее показания часов
+	вычисляются по монотонным часам компьютера; повторное считывание -- только около полуночи
+	счётчика (в пределах margin секунд), когда может смениться дата.
+
+	Example:
+	clock = MeterClock.MeterClock(session.read)
+	days_ago = (clock.date(duration=10.) - request_date).days
+	"""
+
+	MARGIN = 60.  # seconds: clock reading resolution, link delays & clocks drift during session
+	POLL_INTERVAL = 20.  # seconds: clock reading interval while waiting for midnight, less than session inactivity timeout
+
+	def __init__(self, read, margin=MARGIN, poll_interval=POLL_INTERVAL):
+		"""read -- function(obis) returns OBIS value text, e.g. Session.read"""
+		self.read = read
+		self.margin = margin
+		self.poll_interval = poll_interval
+		self.base = None  # meter datetime at the host monotonic time base_time
+		self.base_time = None
+		self.syncs = 0
+
+	def sync(self):
+		"""Reads meter date & time: time, date, time again if midnight passed"""
+		read_time = time.monotonic()
+		meter_time = ObisDecoders.decode(TIME_OBIS, self.read(TIME_OBIS))
+		base_time = (read_time + time.monotonic()) / 2
+		for tries_counter in range(3):
+			meter_date = ObisDecoders.decode(DATE_OBIS, self.read(DATE_OBIS))
+			read_time = time.monotonic()
+			meter_time2 = ObisDecoders.decode(TIME_OBIS, self.read(TIME_OBIS))
+			if meter_time2 >= meter_time:
+				break
+			# midnight passed between time & date reading
+			meter_time = meter_time2
+			base_time = (read_time + time.monotonic()) / 2
+		else:
+			raise Mek61107.Mek61107.Mek61107Exception('Can\'t read meter date & time')
+		self.base = datetime.datetime.combine(meter_date, meter_time)
+		self.base_time = base_time
+		self.syncs += 1
+
+	def now(self):
+		"""Returns meter datetime"""
+		if self.base is None:
+			self.sync()
+		return self.base + datetime.timedelta(seconds=time.monotonic() - self.base_time)
+
+	def offset(self):
+		"""Returns meter clock offset to the host clock, seconds"""
+		return (self.now() - datetime.datetime.now()).total_seconds()
+
+	def date(self, duration=0.):
+		"""Returns meter date that is not changed during the next duration seconds:
+		waits for the meter midnight if it is nearer than duration + margin reading the clock every
+		poll_interval seconds (the exchanges keep the meter session alive) till the date changes"""
+		now = self.now()
+		midnight = datetime.datetime.combine(now.date(), datetime.time())
+		before = (midnight - now).total_seconds() + 24 * 3600
+		if before < duration + self.margin:
+			date = now.date()
+			deadline = time.monotonic() + before + 2 * self.margin
+			while True:
+				time.sleep(min(self.poll_interval, max(before, 0.) + 1.))
+				self.sync()
+				if self.base.date() > date or time.monotonic() >= deadline:
+					break
+				before = (midnight - self.now()).total_seconds() + 24 * 3600
+		elif (now - midnight).total_seconds() < self.margin and self.base < midnight:
+			# the date changed by the model only
+			self.sync()
+		return self.now().date()
+
+	def __str__(self):
+		return 'meter clock: {}'.format('-' if self.base is None else self.now().isoformat(' ', 'seconds'))
@@ -0,0 +1,119 @@
+#!/usr/bin/env python2
+# coding: utf-8
+
+
+class Meter:
+	"""Счётчик на шине конвертера"""
+
+	__slots__ = ('address', 'password')
+
+	def __init__(self, address='', password='00000000'):
+		"""address -- адрес устройства для запроса /?address!; '' - единственный счётчик на шине"""
+		self.address = address
+		self.password = password
+
+	def __repr__(self):
+		return 'Meter({!r})'.format(self.address)
+
+
+class Converter:
+	"""Конвертер RS485 - TCP/IP и его счётчики"""
+
+	__slots__ = ('imei', 'meters', 'schedule', 'poller')
+
+	def __init__(self, imei, meters=(), schedule=None, poller=None):
+		"""meters -- list of Meter
+		schedule -- polling schedule of the converter meters, e.g. poll interval, seconds
+		poller -- async function(protocol, converter) overriding server handler; None - server handler"""
+		self.imei = imei
+		self.meters = list(meters)
+		self.schedule = schedule
+		self.poller = poller
+
+	def __repr__(self):
+		return 'Converter({!r}, {!r})'.format(self.imei, self.meters)
+
+
+class MeterRegistry:
+	"""Реестр конвертеров и счётчиков в памяти: поиск по IMEI и по адресу счётчика за O(1)
+
+	Example:
+	registry = MeterRegistry.MeterRegistry()
+	registry.add(MeterRegistry.Converter('080255635', [MeterRegistry.Meter('9144')], schedule=1800))
+	converter = registry.get('080255635')
+	"""
+
+	def __init__(self, converters=()):
+		self.converters = {}  # imei: Converter
+		self.meters = {}  # meter address: Converter
+		for converter in converters:
+			self.add(converter)
+
+	def add(self, converter):
+		self.remove(converter.imei)
+		self.converters[converter.imei] = converter
+		for meter in converter.meters:
+			if meter.address:
+				self.meters[meter.address] = converter
+		return converter
+
+	def remove(self, imei):
+		converter = self.converters.pop(imei, None)
+		if converter is not None:
+			for meter in converter.meters:
+				if self.meters.get(meter.address) is converter:
+					del self.meters[meter.address]
+		return converter
+
+	def get(self, imei):
+		"""Returns Converter or None"""
+		return self.converters.get(imei)
+
+	def find_meter(self, address):
+		"""Returns Converter of the meter address or None"""
+		return self.meters.get(address)
+
+	def __len__(self):
+		return len(self.converters)
+
+	def __contains__(self, imei):
+		return imei in self.converters
+
+
+class WrongBanner(Exception):
+	def __init__(self, buff):
+		self.buff = buff
+
+	def __str__(self):
+		return 'Wrong converter banner: ' + \
+			(self.buff.decode('latin').encode('unicode_escape').decode('latin') if len(self.buff) > 0 else '<no data>')
+
+
+def parse_banner(buff):
+	"""Returns dict of 'key:value' lines of the banner sent by converter after connection, e.g.:
+	b'imei:080255635\\nversion:1.0\\nD<<10 0 0<<\\n' -> {'imei': '080255635', 'version': '1.0'}
+	"""
+	ret = {}
+	for line in buff.decode('latin').split('\n'):
+		key, delimiter, value = line.partition(':')
+		if delimiter:
+			ret[key.strip().lower()] = value.strip()
+	return ret
+
+
+async def receive_banner(protocol, key='imei'):
+	"""Receives converter banner up to the key line by NevaMt3xx_async protocol without any request;
+	bytes after the key line stay in protocol.parser for connect().
+	Returns dict, see parse_banner; raises WrongBanner on timeout or connection closed"""
+	lines = []
+	while True:
+		line = protocol.parser.get_line(b'\n')
+		if line is not None:
+			lines.append(line)
+			if key in parse_banner(line.encode('latin')):
+				return parse_banner('\n'.join(lines).encode('latin'))
+			continue
+		buff = await protocol.read()
+		if len(buff) == 0:
+			raise WrongBanner(''.join(line + '\n' for line in lines).encode('latin') + bytes(protocol.parser.buff))
+		protocol.parser.feed(buff)
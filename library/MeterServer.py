@@ -0,0 +1,149 @@
+#!/usr/bin/env python2
+# coding: utf-8
+
+import asyncio
+import contextlib
+import logging
+import signal
+
+from library import MeterRegistry, NevaMt3xx
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class MeterServer:
+	"""Сервер сбора данных: принимает одновременные подключения конвертеров
+	RS485 - TCP/IP в режиме TCP клиента; для каждого подключения создаётся свой
+	сеанс NevaMt3xx_async и вызывается handler.
+
+	Example:
+	from library import NevaMt3xx, MeterServer
+	async def poll(protocol, client_address):
+		company, device = await protocol.connect()
+		if not await protocol.login('00000000'):
+			raise Exception('Access denied')
+		await protocol.send(NevaMt3xx.NevaMt3xx.Command('R1', '000902FF()'))
+		print(client_address, (await protocol.receive()).data)
+		await protocol.logout()
+	server = MeterServer.MeterServer(poll, port=18899, backlog=100, deadline=60)
+	server.run()
+	"""
+
+	def __init__(self, handler, host='', port=18899, backlog=100, timeout=5, deadline=None, log=None, log_bytes=False):
+		"""handler -- async function(protocol, client_address) called for every connection
+		backlog -- listen queue length
+		timeout -- seconds to wait for received bytes, see NevaMt3xx_async
+		deadline -- seconds for whole connection handling; None - unlimited
+		log, log_bytes -- see NevaMt3xx.LogBase"""
+		self.handler = handler
+		self.host = host
+		self.port = port
+		self.backlog = backlog
+		self.timeout = timeout
+		self.deadline = deadline
+		self.log = log
+		self.log_bytes = log_bytes
+		self.server = None
+		self.connections = set()  # tasks of connections being handled
+
+	def make_protocol(self, reader, writer):
+		"""Successor can override the session protocol"""
+		return NevaMt3xx.NevaMt3xx_async(reader, writer, log=self.log, log_bytes=self.log_bytes, timeout=self.timeout)
+
+	async def handle_connection(self, reader, writer):
+		"""Successor can override connection handling, e.g. to identify the converter"""
+		await self.handler(self.make_protocol(reader, writer), writer.get_extra_info('peername'))
+
+	async def _on_connection(self, reader, writer):
+		task = asyncio.current_task()
+		self.connections.add(task)
+		client_address = writer.get_extra_info('peername')
+		try:
+			await asyncio.wait_for(self.handle_connection(reader, writer), self.deadline)
+		except asyncio.TimeoutError:
+			_LOGGER.warning('%s: connection deadline %s s exceeded', client_address, self.deadline)
+		except asyncio.CancelledError:
+			_LOGGER.info('%s: connection cancelled', client_address)
+		except Exception:
+			_LOGGER.exception('%s: connection error', client_address)
+		finally:
+			writer.close()
+			try:
+				with contextlib.suppress(ConnectionError, OSError):
+					await writer.wait_closed()  # the transport is closed before shutdown() returns
+			finally:
+				self.connections.discard(task)
+
+	async def start(self):
+		self.server = await asyncio.start_server(self._on_connection, self.host, self.port, backlog=self.backlog)
+		return self.server
+
+	async def shutdown(self, timeout=10):
+		"""Stops accepting connections, waits up to timeout seconds for connections
+		being handled and cancels the rest"""
+		if self.server is not None:
+			self.server.close()
+			self.server = None
+		if self.connections:
+			done, pending = await asyncio.wait(set(self.connections), timeout=timeout)
+			for task in pending:
+				task.cancel()
+			if pending:
+				await asyncio.wait(pending)
+
+	async def serve_forever(self, shutdown_timeout=10):
+		"""Serves connections until SIGINT/SIGTERM, then shuts down gracefully"""
+		stop = asyncio.Event()
+		loop = asyncio.get_running_loop()
+		for sig in (signal.SIGINT, signal.SIGTERM):
+			try:
+				loop.add_signal_handler(sig, stop.set)
+			except (NotImplementedError, RuntimeError):
+				pass  # Windows
+		await self.start()
+		try:
+			await stop.wait()
+		finally:
+			await self.shutdown(shutdown_timeout)
+
+	def run(self, shutdown_timeout=10):
+		asyncio.run(self.serve_forever(shutdown_timeout))
+
+
+class RoutingMeterServer(MeterServer):
+	"""Сервер сбора данных с идентификацией конвертера по IMEI из начальных данных,
+	передаваемых конвертером сразу после подключения (например: "imei:080255635\\nversion:1.0\\n..."):
+	конвертер ищется в реестре MeterRegistry и подключение передаётся его опросчику
+	без дополнительных запросов.
+
+	Example:
+	from library import MeterRegistry, MeterServer
+	async def poll(protocol, converter):
+		for meter in converter.meters:
+			...
+	registry = MeterRegistry.MeterRegistry([MeterRegistry.Converter('080255635', [MeterRegistry.Meter()])])
+	MeterServer.RoutingMeterServer(registry, poll, port=18899).run()
+	"""
+
+	def __init__(self, registry, handler, unknown_handler=None, banner_key='imei', **kwargs):
+		"""handler -- async function(protocol, converter) called for registered converters
+		unknown_handler -- async function(protocol, banner) called for not registered converters;
+			None - connection is closed
+		banner_key -- banner key identifying the converter
+		kwargs -- see MeterServer"""
+		MeterServer.__init__(self, handler, **kwargs)
+		self.registry = registry
+		self.unknown_handler = unknown_handler
+		self.banner_key = banner_key
+
+	async def handle_connection(self, reader, writer):
+		protocol = self.make_protocol(reader, writer)
+		banner = await MeterRegistry.receive_banner(protocol, self.banner_key)
+		converter = self.registry.get(banner.get(self.banner_key))
+		if converter is None:
+			if self.unknown_handler is not None:
+				await self.unknown_handler(protocol, banner)
+			else:
+				_LOGGER.warning('%s: unknown converter: %s', writer.get_extra_info('peername'), banner)
+			return
+		await (converter.poller or self.handler)(protocol, converter)
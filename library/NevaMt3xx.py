@@ -1,24 +1,59 @@
 #!/usr/bin/env python2
 # coding: utf-8
 
-from library import Mek61107
+import asyncio
+import socket
+import time
+
+from library import AdaptiveTimeout, Mek61107
 
 
 class NevaMt3xx(Mek61107.Mek61107):
 	"""Протокол работы со счётчиками НЕВА МТ3XХ"""
 
+	class BccXor(Mek61107.Mek61107.Bcc):
+		"""XOR of bytes: chunk is taken as wide integer and folded in halves"""
+
+		def update(self, data):
+			size = len(data)
+			if size == 0:
+				return
+			value = int.from_bytes(data, 'little')
+			while size > 1:
+				size = (size + 1) // 2
+				value = (value >> (size * 8)) ^ (value & ((1 << (size * 8)) - 1))
+			self.value ^= value
+
+	BCC = BccXor
+
 	def __init__(self, initial_baudrate=9600):
 		Mek61107.Mek61107.__init__(self, initial_baudrate=initial_baudrate)
 
-	def is_bcc_correct(self, buff, end_index, start_index=1):
-		return NevaMt3xx.calculate_bcc_xor(buff[1:end_index+1]) == ord(buff[end_index+1])
-
 	@staticmethod
 	def calculate_bcc_xor(buff):
-		ret = 0
-		for b in buff:
-			ret ^= ord(b)
-		return ret
+		return NevaMt3xx.BccXor.calculate(buff)
+
+	def readout(self, v='0', address=''):
+		"""Data readout (mode C, y='0'): returns dict {address: value} of the meter data block.
+		Successor implements iter_readout"""
+		return dict(self.iter_readout(v=v, address=address))
+
+	def login(self, password):
+		"""Password exchange after connect(); returns True if access granted.
+		Successor implements receive & send"""
+		cmd = self.receive()
+		if not cmd.is_command or cmd.command != 'P0':
+			raise Mek61107.Mek61107.Mek61107Exception('Command "P0" expected')
+		self.send(NevaMt3xx.Command('P1', '(' + password + ')'))
+		cmd = self.receive()
+		return cmd.is_ack
+
+	def logout(self, pause=.5):
+		"""pause -- seconds before repeated B0 command; None - B0 command is sent once"""
+		self.send(NevaMt3xx.Command('B0', ''))
+		if pause is not None:
+			time.sleep(pause)
+			self.send(NevaMt3xx.Command('B0', ''))
 
 
 class LogBase:
@@ -78,39 +113,59 @@ class NevaMt3xx_com(NevaMt3xx):
 		print u'ERROR: '+str(e)
 	"""
 
-	def __init__(self, port, log=None, log_bytes=False):
+	def __init__(self, port, log=None, log_bytes=False, timeouts=None):
+		"""timeouts -- AdaptiveTimeout.LinkTimeouts of the link; None - default"""
 		NevaMt3xx.__init__(self)
 		self.port = port
 		self.log = log
 		self.log_bytes = log_bytes
+		self.timeouts = AdaptiveTimeout.LinkTimeouts() if timeouts is None else timeouts
+		self.parser = self.make_parser()
+
+	def read(self):
+		"""Reads bytes already received by the port, waits adaptive timeout for 1 byte at least"""
+		timeout = round(self.timeouts.timeout(), 2)
+		if self.port.timeout != timeout:
+			self.port.timeout = timeout
+		buff = self.port.read(max(1, self.port.in_waiting))
+		if len(buff) == 0:
+			self.timeouts.expired()
+			return buff
+		self.timeouts.received()
+		if self.log is not None and self.log_bytes:
+			self.log.log_rcv(buff.decode('latin'))
+		return buff
 
 	def receive_line(self):
-		buff = ''
 		while True:
-			buff2 = self.port.read(1).decode('ascii')
-			if len(buff2) == 0:
-				return ''
-			if self.log is not None and self.log_bytes:
-				self.log.log_rcv(buff2)
-			buff += buff2[0]
-			buff3 = self.get_line(buff)
-			if len(buff3) > 0:
+			buff = self.parser.get_line()
+			if buff is not None:
+				self.timeouts.frame_received()
 				if self.log is not None:
 					self.log.log_rcv(buff)
-				print (buff3)
-				return buff3
+				return buff
+			buff = self.read()
+			if len(buff) == 0:
+				return ''
+			self.parser.feed(buff)
 
-	def connect(self, y='1', v='0'):
+	def connect(self, y='1', v='0', address=''):
+		"""address -- meter address on multi-drop bus; '' - any meter, see make_request"""
 		buff = ''
+		self.parser.clear()
 		# посылка запроса
 		if self.port.baudrate != self.initial_baudrate:
 			self.port.baudrate = self.initial_baudrate
-		buff = NevaMt3xx.make_request()
+		buff = NevaMt3xx.make_request(address)
 		if self.log is not None:
 			self.log.log_snd(buff)
 		self.port.write(buff.encode())
+		self.timeouts.sent()
 		# приём индификационного сообщения
 		buff = self.receive_line()
+		# данные до идентификационного сообщения (строки приветствия конвертера, остатки кадров)
+		# отбрасываются: идентификатор счётчика не содержит '/'
+		buff = ''.join(buff.rpartition('/')[1:])
 		company, baudrate, device = self.get_id_message(buff)
 		# print(company, device)
 		if self.log is not None:
@@ -120,32 +175,54 @@ class NevaMt3xx_com(NevaMt3xx):
 		if self.log is not None:
 			self.log.log_snd(buff)
 		self.port.write(buff.encode())
+		self.timeouts.sent()
 		# обмен сообщениями
 		if self.port.baudrate != baudrate:
 			self.port.baudrate = baudrate
 		return company, device
 
 	def receive(self):
-		buff = ''
+		buff = b''
 		while True:
-			buff2 = self.port.read(1).decode('ascii')
-			if len(buff2) == 0:
-				return Mek61107.Mek61107.CommandBase()
-			if self.log is not None and self.log_bytes:
-				self.log.log_rcv(buff2)
-			buff += buff2
-			cmd = self.parse(buff)
-			if cmd is not None:
+			for cmd in self.parser.feed(buff):
+				self.timeouts.frame_received()
 				if self.log is not None:
 					self.log.log_rcv(str(cmd))
-				# print (cmd)
 				return cmd
+			buff = self.read()
+			if len(buff) == 0:
+				self.parser.clear()  # the rest of a late answer must not be taken for the next answer
+				return Mek61107.Mek61107.CommandBase()
+
+	def iter_readout(self, v='0', address=''):
+		"""Data readout (mode C, y='0'): connects and yields data sets (address, value)
+		of the meter data block while it is still being received"""
+		self.connect(y='0', v=v, address=address)
+		parser = self.make_readout_parser()
+		buff = bytes(self.parser.buff)
+		self.parser.clear()
+		while True:
+			for data_set in parser.feed(buff):
+				yield data_set
+			if parser.is_finished:
+				self.timeouts.frame_received()
+				return
+			buff = self.read()
+			if len(buff) == 0:
+				raise Mek61107.Mek61107.Mek61107Exception('Data readout interrupted')
 
 	def send(self, cmd):
-		buff = cmd.serialize(calculate_bcc_func=NevaMt3xx.calculate_bcc_xor)
 		if self.log is not None:
 			self.log.log_snd(str(cmd))
-		self.port.write(buff.encode())
+		self.port.write(self.serialize_frame(cmd))
+		self.timeouts.sent()
+
+	def send_command(self, command, data=''):
+		"""Sends command frame prebuilt by the frame cache"""
+		if self.log is not None:
+			self.log.log_snd('Command: ' + command + '; data: ' + data)
+		self.port.write(self.frames.get(command, data))
+		self.timeouts.sent()
 
 
 class NevaMt3xx_tcp(NevaMt3xx):
@@ -182,36 +259,59 @@ class NevaMt3xx_tcp(NevaMt3xx):
 		print u'ERROR: '+str(e)
 	"""
 
-	def __init__(self, connection, log=None, log_bytes=True):
+	def __init__(self, connection, log=None, log_bytes=True, timeouts=None):
+		"""timeouts -- AdaptiveTimeout.LinkTimeouts of the link; None - default"""
 		NevaMt3xx.__init__(self)
 		self.connection = connection
 		self.log = log
 		self.log_bytes = log_bytes
+		self.timeouts = AdaptiveTimeout.LinkTimeouts(AdaptiveTimeout.AdaptiveTimeout(initial=5.)) \
+			if timeouts is None else timeouts
+		self.parser = self.make_parser()
+
+	def read(self):
+		"""Reads bytes received by the connection, waits adaptive timeout for 1 byte at least"""
+		self.connection.settimeout(self.timeouts.timeout())
+		try:
+			buff = self.connection.recv(512)
+		except socket.timeout:
+			self.timeouts.expired()
+			return b''
+		if len(buff) == 0:
+			return buff
+		self.timeouts.received()
+		if self.log is not None and self.log_bytes:
+			self.log.log_rcv(buff.decode('latin'))
+		return buff
 
 	def receive_line(self):
-		buff = ''
 		while True:
-			buff2 = self.connection.recv(128).decode('ascii')
-			if len(buff2) == 0:
-				return ''
-			if self.log is not None and self.log_bytes:
-				self.log.log_rcv(buff2)
-			buff += buff2
-			buff2 = self.get_line(buff)
-			if len(buff2) > 0:
+			buff = self.parser.get_line()
+			if buff is not None:
+				self.timeouts.frame_received()
 				if self.log is not None:
 					self.log.log_rcv(buff)
-				return buff2
+				return buff
+			buff = self.read()
+			if len(buff) == 0:
+				return ''
+			self.parser.feed(buff)
 
-	def connect(self, y='1', v='0'):
+	def connect(self, y='1', v='0', address=''):
+		"""address -- meter address on multi-drop bus; '' - any meter, see make_request"""
 		buff = ''
+		self.parser.clear()
 		# посылка запроса
-		buff = NevaMt3xx.make_request()
+		buff = NevaMt3xx.make_request(address)
 		if self.log is not None:
 			self.log.log_snd(buff)
 		self.connection.sendall(buff.encode('ascii'))
+		self.timeouts.sent()
 		# приём индификационного сообщения
 		buff = self.receive_line()
+		# данные до идентификационного сообщения (строки приветствия конвертера, остатки кадров)
+		# отбрасываются: идентификатор счётчика не содержит '/'
+		buff = ''.join(buff.rpartition('/')[1:])
 		company, baudrate, device = self.get_id_message(buff)
 		if self.log is not None:
 			self.log.log_rcv('Code: {}; baudrate: {}; id: {}'.format(company, baudrate, device))
@@ -220,28 +320,250 @@ class NevaMt3xx_tcp(NevaMt3xx):
 		if self.log is not None:
 			self.log.log_snd(buff)
 		self.connection.sendall(buff.encode('ascii'))
+		self.timeouts.sent()
 		# обмен сообщениями
 		return company, device
 
 	def receive(self):
-		buff = ''
+		buff = b''
 		while True:
-			buff2 = self.connection.recv(512).decode('ascii')
-			if len(buff2) == 0:
-				return Mek61107.Mek61107.CommandBase()
-			if self.log is not None and self.log_bytes:
-				self.log.log_rcv(buff2)
-			buff += buff2
-			cmd = self.parse(buff)
-			if cmd is not None:
+			for cmd in self.parser.feed(buff):
+				self.timeouts.frame_received()
 				if self.log is not None:
 					self.log.log_rcv(str(cmd))
 				return cmd
+			buff = self.read()
+			if len(buff) == 0:
+				self.parser.clear()  # the rest of a late answer must not be taken for the next answer
+				return Mek61107.Mek61107.CommandBase()
+
+	def iter_readout(self, v='0', address=''):
+		"""Data readout (mode C, y='0'): connects and yields data sets (address, value)
+		of the meter data block while it is still being received"""
+		self.connect(y='0', v=v, address=address)
+		parser = self.make_readout_parser()
+		buff = bytes(self.parser.buff)
+		self.parser.clear()
+		while True:
+			for data_set in parser.feed(buff):
+				yield data_set
+			if parser.is_finished:
+				self.timeouts.frame_received()
+				return
+			buff = self.read()
+			if len(buff) == 0:
+				raise Mek61107.Mek61107.Mek61107Exception('Data readout interrupted')
 
 	def send(self, cmd):
-		buff = cmd.serialize(calculate_bcc_func=NevaMt3xx.calculate_bcc_xor)
+		buff = self.serialize_frame(cmd)
 		if self.log is not None:
 			if self.log_bytes:
-				self.log.log_snd(buff)
+				self.log.log_snd(buff.decode('latin'))
 			self.log.log_snd(str(cmd))
-		self.connection.sendall(buff.encode('ascii'))
+		self.connection.sendall(buff)
+		self.timeouts.sent()
+
+	def send_command(self, command, data=''):
+		"""Sends command frame prebuilt by the frame cache"""
+		buff = self.frames.get(command, data)
+		if self.log is not None:
+			if self.log_bytes:
+				self.log.log_snd(buff.decode('latin'))
+			self.log.log_snd('Command: ' + command + '; data: ' + data)
+		self.connection.sendall(buff)
+		self.timeouts.sent()
+
+
+class NevaMt3xx_async(NevaMt3xx):
+	"""Протокол работы со счётчиками НЕВА МТ3XХ через asyncio потоки:
+	tcp соединение с конвертером или последовательный порт (см. open_serial_connection)
+
+	Example:
+	import asyncio
+	from library import NevaMt3xx
+	async def poll(reader, writer):
+		protocol = NevaMt3xx.NevaMt3xx_async(reader, writer, timeout=5)
+		try:
+			company, device = await protocol.connect()
+			if not await protocol.login('00000000'):
+				raise Exception('Access denied')
+			# Дата: ГГММДД
+			await protocol.send(NevaMt3xx.NevaMt3xx.Command('R1', '000902FF()'))
+			cmd = await protocol.receive()
+			if not cmd.is_message:
+				raise Exception('OBIS 000902FF expected')
+			print(cmd.data[8:].strip('()'))
+			await protocol.logout()
+		finally:
+			writer.close()
+	async def main():
+		server = await asyncio.start_server(poll, port=18899)
+		async with server:
+			await server.serve_forever()
+	asyncio.run(main())
+	"""
+
+	def __init__(self, reader, writer, log=None, log_bytes=False, timeout=None, timeouts=None):
+		"""timeout -- seconds to wait for received bytes; None - wait forever
+		timeouts -- AdaptiveTimeout.LinkTimeouts of the link used instead of timeout; None - not used"""
+		NevaMt3xx.__init__(self)
+		self.reader = reader
+		self.writer = writer
+		self.log = log
+		self.log_bytes = log_bytes
+		self.timeout = timeout
+		self.timeouts = timeouts
+		self.parser = self.make_parser()
+
+	async def read(self):
+		"""Reads received bytes; returns empty bytes on timeout or connection closed"""
+		timeout = self.timeout if self.timeouts is None else self.timeouts.timeout()
+		try:
+			buff = await asyncio.wait_for(self.reader.read(512), timeout)
+		except asyncio.TimeoutError:
+			if self.timeouts is not None:
+				self.timeouts.expired()
+			return b''
+		if len(buff) == 0:
+			return buff
+		if self.timeouts is not None:
+			self.timeouts.received()
+		if self.log is not None and self.log_bytes:
+			self.log.log_rcv(buff.decode('latin'))
+		return buff
+
+	def _frame_received(self):
+		if self.timeouts is not None:
+			self.timeouts.frame_received()
+
+	async def write(self, buff):
+		if self.log is not None:
+			self.log.log_snd(buff)
+		self.writer.write(buff.encode('ascii'))
+		await self.writer.drain()
+		if self.timeouts is not None:
+			self.timeouts.sent()
+
+	def set_baudrate(self, baudrate):
+		"""Changes baudrate of serial port stream; does nothing for tcp stream"""
+		port = getattr(self.writer.transport, 'serial', None)
+		if port is not None and port.baudrate != baudrate:
+			port.baudrate = baudrate
+
+	async def receive_line(self):
+		while True:
+			buff = self.parser.get_line()
+			if buff is not None:
+				self._frame_received()
+				if self.log is not None:
+					self.log.log_rcv(buff)
+				return buff
+			buff = await self.read()
+			if len(buff) == 0:
+				return ''
+			self.parser.feed(buff)
+
+	async def connect(self, y='1', v='0', address=''):
+		"""address -- meter address on multi-drop bus; '' - any meter, see make_request;
+		received bytes left in the parser (e.g. by MeterRegistry.receive_banner) are kept"""
+		# посылка запроса
+		self.set_baudrate(self.initial_baudrate)
+		await self.write(NevaMt3xx.make_request(address))
+		# приём индификационного сообщения
+		buff = await self.receive_line()
+		# данные до идентификационного сообщения (строки приветствия конвертера, остатки кадров)
+		# отбрасываются: идентификатор счётчика не содержит '/'
+		buff = ''.join(buff.rpartition('/')[1:])
+		company, baudrate, device = self.get_id_message(buff)
+		if self.log is not None:
+			self.log.log_rcv('Code: {}; baudrate: {}; id: {}'.format(company, baudrate, device))
+		# посылка сообщения подтверждения/выбора опций
+		await self.write(NevaMt3xx.make_ack_message(baudrate, v=v, y=y))
+		# обмен сообщениями
+		self.set_baudrate(baudrate)
+		return company, device
+
+	async def receive(self):
+		buff = b''
+		while True:
+			for cmd in self.parser.feed(buff):
+				self._frame_received()
+				if self.log is not None:
+					self.log.log_rcv(str(cmd))
+				return cmd
+			buff = await self.read()
+			if len(buff) == 0:
+				self.parser.clear()  # the rest of a late answer must not be taken for the next answer
+				return Mek61107.Mek61107.CommandBase()
+
+	async def send(self, cmd):
+		if self.log is not None:
+			self.log.log_snd(str(cmd))
+		self.writer.write(self.serialize_frame(cmd))
+		await self.writer.drain()
+		if self.timeouts is not None:
+			self.timeouts.sent()
+
+	async def send_command(self, command, data=''):
+		"""Sends command frame prebuilt by the frame cache"""
+		if self.log is not None:
+			self.log.log_snd('Command: ' + command + '; data: ' + data)
+		self.writer.write(self.frames.get(command, data))
+		await self.writer.drain()
+		if self.timeouts is not None:
+			self.timeouts.sent()
+
+	async def login(self, password):
+		"""Password exchange after connect(); returns True if access granted"""
+		cmd = await self.receive()
+		if not cmd.is_command or cmd.command != 'P0':
+			raise Mek61107.Mek61107.Mek61107Exception('Command "P0" expected')
+		await self.send(NevaMt3xx.Command('P1', '(' + password + ')'))
+		cmd = await self.receive()
+		return cmd.is_ack
+
+	async def logout(self, pause=.5):
+		"""pause -- seconds before repeated B0 command; None - B0 command is sent once"""
+		await self.send(NevaMt3xx.Command('B0', ''))
+		if pause is not None:
+			await asyncio.sleep(pause)
+			await self.send(NevaMt3xx.Command('B0', ''))
+
+	async def iter_readout(self, v='0', address=''):
+		"""Data readout (mode C, y='0'): connects and yields data sets (address, value)
+		of the meter data block while it is still being received"""
+		await self.connect(y='0', v=v, address=address)
+		parser = self.make_readout_parser()
+		buff = bytes(self.parser.buff)
+		self.parser.clear()
+		while True:
+			for data_set in parser.feed(buff):
+				yield data_set
+			if parser.is_finished:
+				self._frame_received()
+				return
+			buff = await self.read()
+			if len(buff) == 0:
+				raise Mek61107.Mek61107.Mek61107Exception('Data readout interrupted')
+
+	async def readout(self, v='0', address=''):
+		"""Data readout (mode C, y='0'): returns dict {address: value} of the meter data block"""
+		return {obis: value async for obis, value in self.iter_readout(v=v, address=address)}
+
+
+async def open_serial_connection(port, baudrate=9600, **kwargs):
+	"""Opens serial port as asyncio streams (reader, writer) for NevaMt3xx_async.
+	Requires pyserial-asyncio package.
+
+	Example:
+	reader, writer = await NevaMt3xx.open_serial_connection('/dev/ttyUSB0')
+	protocol = NevaMt3xx.NevaMt3xx_async(reader, writer, timeout=2)
+	"""
+	import serial
+	import serial_asyncio
+	return await serial_asyncio.open_serial_connection(
+		url=port, baudrate=baudrate,
+		bytesize=serial.SEVENBITS,
+		parity=serial.PARITY_EVEN,
+		stopbits=serial.STOPBITS_ONE,
+		**kwargs)
@@ -0,0 +1,185 @@
+#!/usr/bin/env python2
+# coding: utf-8
+
+import re
+
+
+class WrongObis(ValueError):
+	def __init__(self, code):
+		self.code = code
+
+	def __str__(self):
+		return 'Wrong OBIS code: ' + repr(self.code)
+
+
+_SEPARATORS = re.compile(r'[-:.*]')
+
+
+def _parse_groups(code):
+	"""Returns tuple of value groups of OBIS code: '63.01.00*05', '63010005', '000902FF()'"""
+	if code.endswith('()'):
+		code = code[:-2]
+	try:
+		if _SEPARATORS.search(code):
+			groups = tuple(int(group, 16) for group in _SEPARATORS.split(code))
+		else:
+			if len(code) % 2:
+				raise ValueError()
+			groups = tuple(bytes.fromhex(code))
+	except ValueError:
+		raise WrongObis(code)
+	if not 1 <= len(groups) <= 6 or any(group > 0xFF for group in groups):
+		raise WrongObis(code)
+	if len(groups) == 3:
+		groups += (0xFF,)  # '630100' -> '630100FF'
+	return groups
+
+
+def _format_groups(groups):
+	"""Returns display form of value groups strings: 'CC.DD.EE*FF', 'B:C.D.E*F' for 5 value groups
+	or 'A-B:C.D.E*F' for 6 value groups"""
+	ret = '.'.join(groups[-4:-1]) + '*' + groups[-1] if len(groups) >= 4 else '.'.join(groups)
+	if len(groups) == 6:
+		ret = groups[0] + '-' + groups[1] + ':' + ret
+	elif len(groups) == 5:
+		ret = groups[0] + ':' + ret
+	return ret
+
+
+class Obis:
+	"""OBIS код: разбирается один раз, экземпляры интернируются (один объект на код),
+	поэтому годится как дешёвый ключ словаря.
+	display -- '63.01.00*05'; wire -- '63010005' (вид в командах R1/W1); key -- упакованное целое
+	значение групп кода (до 6 байт).
+
+	Example:
+	obis = Obis.Obis('63.01.00*05')
+	assert obis is Obis.Obis('63010005')
+	protocol.send_command('R1', obis.read_data)
+	value = obis.value_of(protocol.receive().data)
+	"""
+
+	__slots__ = ('groups', 'display', 'wire', 'key', 'read_data', '_prefix')
+
+	_registry = {}  # code (any form) or key: Obis
+
+	def __new__(cls, code):
+		if isinstance(code, Obis):
+			return code
+		obis = cls._registry.get(code)
+		if obis is None:
+			obis = cls._from_groups(_parse_groups(code))
+			cls._registry[code] = obis
+		return obis
+
+	@classmethod
+	def _from_groups(cls, groups):
+		key = int.from_bytes(bytes(groups), 'big') | (len(groups) << 48)
+		obis = cls._registry.get(key)
+		if obis is None:
+			obis = object.__new__(cls)
+			obis.groups = groups
+			obis.display = _format_groups(['{:02X}'.format(group) for group in groups])
+			obis.wire = bytes(groups).hex().upper()
+			obis.key = key
+			obis.read_data = obis.wire + '()'
+			obis._prefix = obis.wire + '('
+			cls._registry[key] = obis
+		return obis
+
+	def __reduce__(self):
+		return Obis, (self.wire,)
+
+	def __str__(self):
+		return self.display
+
+	def __repr__(self):
+		return 'Obis({!r})'.format(self.display)
+
+	def __hash__(self):
+		return hash(self.key)
+
+	def __eq__(self, other):
+		return self is other or (isinstance(other, Obis) and self.key == other.key)
+
+	def __lt__(self, other):
+		return self.key < other.key
+
+	def value_of(self, data):
+		"""Returns value of R1 answer data: '63010005(...)' -> '...'; None - answer of another OBIS code"""
+		if not data.startswith(self._prefix) or not data.endswith(')'):
+			return None
+		return data[len(self._prefix):-1]
+
+	def replace(self, index, value):
+		"""Returns OBIS code with value group index replaced, e.g. obis.replace(-1, days_ago)"""
+		groups = list(self.groups)
+		groups[index] = value
+		return Obis._from_groups(tuple(groups))
+
+
+class ObisRange:
+	"""Диапазон OBIS кодов по одной группе значений: '63.01.00*[0..7F]';
+	итерация выдаёт интернированные Obis по возрастанию.
+
+	Example:
+	for obis in Obis.ObisRange('63.01.00*[0..7F]'):
+		...
+	assert Obis.Obis('63.01.00*05') in Obis.ObisRange('63.01.00*[0..7F]')
+	"""
+
+	__slots__ = ('base', 'index', 'first', 'last', 'display')
+
+	def __init__(self, code):
+		begin_index = code.find('[')
+		end_index = code.find(']', begin_index)
+		if begin_index < 0 or end_index < 0:
+			raise WrongObis(code)
+		first, delimiter, last = code[begin_index + 1:end_index].partition('..')
+		try:
+			self.first = int(first, 16)
+			self.last = int(last, 16) if delimiter else self.first
+		except ValueError:
+			raise WrongObis(code)
+		# range value group index: count of groups before '['
+		prefix = code[:begin_index]
+		groups = _parse_groups(prefix + '{:02X}'.format(self.first) + code[end_index + 1:])
+		self.index = len(_SEPARATORS.findall(prefix)) if _SEPARATORS.search(prefix) else len(prefix) // 2
+		if not 0 <= self.first <= self.last <= 0xFF or self.index >= len(groups):
+			raise WrongObis(code)
+		self.base = Obis._from_groups(groups)
+		groups = ['{:02X}'.format(group) for group in groups]
+		groups[self.index] = '[{:02X}..{:02X}]'.format(self.first, self.last)
+		self.display = _format_groups(groups)
+
+	def __str__(self):
+		return self.display
+
+	def __repr__(self):
+		return 'ObisRange({!r})'.format(self.display)
+
+	def __len__(self):
+		return self.last - self.first + 1
+
+	def __getitem__(self, i):
+		if i < 0:
+			i += len(self)
+		if not 0 <= i < len(self):
+			raise IndexError(i)
+		return self.base.replace(self.index, self.first + i)
+
+	def __iter__(self):
+		for value in range(self.first, self.last + 1):
+			yield self.base.replace(self.index, value)
+
+	def __contains__(self, obis):
+		obis = Obis(obis)
+		groups = obis.groups
+		base = self.base.groups
+		return len(groups) == len(base) and self.first <= groups[self.index] <= self.last and \
+			groups[:self.index] == base[:self.index] and groups[self.index + 1:] == base[self.index + 1:]
+
+
+def parse(code):
+	"""Returns Obis or ObisRange for code with range: '63.01.00*[0..7F]'"""
+	return ObisRange(code) if '[' in code else Obis(code)
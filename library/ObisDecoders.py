@@ -0,0 +1,172 @@
+#!/usr/bin/env python2
+# coding: utf-8
+
+import datetime
+import re
+
+from library import Obis
+
+
+class WrongValue(ValueError):
+	def __init__(self, name, value):
+		self.name = name
+		self.value = value
+
+	def __str__(self):
+		return 'Wrong {} value: {!r}'.format(self.name, self.value)
+
+
+_DECIMAL = re.compile(r'\s*([-+]?)(\d*)(?:\.(\d*))?\s*$')
+
+
+def fixed_point(scale):
+	"""Returns parser of decimal text to integer count of 10**-scale units without float:
+	fixed_point(3)('00012.345') -> 12345; excess fraction digits are truncated"""
+	def parse(value):
+		match = _DECIMAL.match(value)
+		if match is None:
+			raise ValueError(value)
+		sign, integer, fraction = match.groups('')
+		if not integer and not fraction:
+			raise ValueError(value)
+		ret = int((integer or '0') + fraction[:scale].ljust(scale, '0'))
+		return -ret if sign == '-' else ret
+
+	return parse
+
+
+def parse_number(value):
+	"""Returns int or float of decimal text: '00230' -> 230, '0230.15' -> 230.15; None - not a number"""
+	match = _DECIMAL.match(value)
+	if match is None:
+		return None
+	sign, integer, fraction = match.groups('')
+	if not integer and not fraction:
+		return None
+	ret = int((integer or '0') + fraction)
+	if fraction:
+		ret /= 10 ** len(fraction)
+	return -ret if sign == '-' else ret
+
+
+def parse_date(value):
+	"""'ГГММДД' -> datetime.date"""
+	if len(value) != 6 or not value.isdigit():
+		raise ValueError(value)
+	return datetime.date(2000 + int(value[:2]), int(value[2:4]), int(value[4:]))
+
+
+def parse_time(value):
+	"""'ЧЧММСС' -> datetime.time"""
+	if len(value) != 6 or not value.isdigit():
+		raise ValueError(value)
+	return datetime.time(int(value[:2]), int(value[2:4]), int(value[4:]))
+
+
+class Decoder:
+	"""Декодер значения OBIS кода (данных ответа R1 без скобок).
+	Числа -- целые в единицах 10**-scale unit (энергия: unit 'kWh', scale 3 -> Wh).
+	count: None -- одно значение; 0 -- список значений через ',' любой длины; n -- ровно n значений"""
+
+	__slots__ = ('name', 'unit', 'scale', 'count', 'parse')
+
+	def __init__(self, name, parse, unit='', scale=None, count=None):
+		"""parse -- function(text) returns value or raises ValueError
+		scale -- decimal digits of integer value, None - not a fixed-point number"""
+		self.name = name
+		self.unit = unit
+		self.scale = scale
+		self.count = count
+		self.parse = parse
+
+	def __call__(self, value):
+		"""Returns decoded value or tuple of values; raises WrongValue"""
+		try:
+			if self.count is None:
+				return self.parse(value)
+			ret = tuple(map(self.parse, value.split(',')))
+		except ValueError:
+			raise WrongValue(self.name, value)
+		if self.count and len(ret) != self.count:
+			raise WrongValue(self.name, value)
+		return ret
+
+	def real(self, value):
+		"""Returns float (or tuple of floats) of decoded fixed-point value, other values as is"""
+		if self.scale is None:
+			return value
+		if self.count is None:
+			return value / 10 ** self.scale
+		return tuple(v / 10 ** self.scale for v in value)
+
+	def format(self, value):
+		"""Returns text of decoded value: 23015 -> '230.15' (scale 2)"""
+		if not self.scale:
+			return str(value)
+		integer, fraction = divmod(abs(value), 10 ** self.scale)
+		return '{}{}.{:0{}}'.format('-' if value < 0 else '', integer, fraction, self.scale)
+
+	def __repr__(self):
+		return 'Decoder({!r})'.format(self.name)
+
+
+TEXT = Decoder('text', str)
+DATE = Decoder('date', parse_date)  # Дата: ГГММДД
+TIME = Decoder('time', parse_time)  # Время: ЧЧММСС
+VOLTAGE = Decoder('voltage', fixed_point(2), 'V', 2)
+CURRENT = Decoder('current', fixed_point(3), 'A', 3)
+POWER = Decoder('power', fixed_point(3), 'kW', 3)
+POWER_FACTOR = Decoder('power factor', fixed_point(3), '', 3, 0)  # по фазам (E = FF): список значений
+FREQUENCY = Decoder('frequency', fixed_point(2), 'Hz', 2)
+TEMPERATURE = Decoder('temperature', fixed_point(0), 'C', 0)
+# энергия по тарифам: [T0-суммарный тариф, T1, T2, T3, T4], Wh
+TARIFF_ENERGIES = Decoder('tariff energies', fixed_point(3), 'kWh', 3, 5)
+# получасовой профиль: 48 значений, первые..последние 30 минут суток
+HALF_HOURS = Decoder('half hours', int, 'W', 0, 48)
+
+DECODERS = {}  # Obis: Decoder
+
+
+def register(code, decoder):
+	"""Registers decoder of OBIS code, ObisRange or code with range: '63.01.00*[00..7F]'"""
+	code = Obis.parse(code) if isinstance(code, str) else code
+	for obis in code if isinstance(code, Obis.ObisRange) else (code,):
+		DECODERS[obis] = decoder
+
+
+def decoder_of(obis):
+	"""Returns registered decoder of OBIS code; TEXT - not registered"""
+	return DECODERS.get(Obis.Obis(obis), TEXT)
+
+
+def decode(obis, value):
+	"""Returns value of OBIS code decoded by registered decoder; raises WrongValue"""
+	return decoder_of(obis)(value)
+
+
+def real(obis, value):
+	"""Returns float (tuple of floats) of fixed-point value or decoded value of OBIS code;
+	number or text for not registered code"""
+	decoder = DECODERS.get(Obis.Obis(obis))
+	if decoder is None:
+		number = parse_number(value)
+		return value if number is None else number
+	return decoder.real(decoder(value))
+
+
+register('00.09.01*FF', TIME)
+register('00.09.02*FF', DATE)
+register('60.01.00*FF', TEXT)  # ID счетчика
+register('60.01.01*FF', TEXT)  # Адрес счетчика
+register('60.01.04*FF', TEXT)  # Модель счетчика
+register('60.01.0A*FF', TEXT)  # Место установки
+register('60.09.00*FF', TEMPERATURE)
+register('0C.07.00*FF', VOLTAGE)  # Напряжение по сумме фаз
+register('0B.07.00*FF', CURRENT)  # Ток по сумме фаз
+register('10.07.00*FF', POWER)  # Активная мощность
+register('0D.07.FF*FF', POWER_FACTOR)
+register('0E.07.01*FF', FREQUENCY)
+register('0F.08.80*FF', TARIFF_ENERGIES)  # Активная энергия нарастающим итогом
+register('0F.08.80*[00..0C]', TARIFF_ENERGIES)  # на начало месяцев
+register('0F.80.80*[00..7F]', TARIFF_ENERGIES)  # за сутки
+register('63.01.00*[00..7F]', HALF_HOURS)
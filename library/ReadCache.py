@@ -0,0 +1,103 @@
+#!/usr/bin/env python2
+# coding: utf-8
+
+import datetime
+import time
+
+from library import Obis
+
+# классы времени жизни значений OBIS кодов
+STATIC = 'static'  # не меняются без записи W1: идентификация, расписания; хранятся до записи
+# меняются со сменой суток счётчика: архивы прошедших суток и месяцев (индекс -- суток/месяцев назад);
+# хранятся до полуночи по часам счётчика (MeterClock)
+DAILY = 'daily'
+INSTANTANEOUS = 'instantaneous'  # текущие измерения, дата и время: не хранятся (или ttl секунд)
+
+TTL_CLASSES = {}  # Obis: TTL class
+
+
+def register(code, ttl_class):
+	"""Registers TTL class of OBIS code, ObisRange or code with range: '0F.80.80*[01..7F]'"""
+	code = Obis.parse(code) if isinstance(code, str) else code
+	for obis in code if isinstance(code, Obis.ObisRange) else (code,):
+		TTL_CLASSES[obis] = ttl_class
+
+
+def ttl_class_of(obis):
+	"""Returns registered TTL class of OBIS code; INSTANTANEOUS - not registered"""
+	return TTL_CLASSES.get(Obis.Obis(obis), INSTANTANEOUS)
+
+
+class ReadCache:
+	"""Кэш считанных значений OBIS кодов (read-through, см. Session.read): время жизни значения
+	задаётся классом OBIS кода; значение удаляется при записи W1 этого кода (Session.write),
+	все значения -- при записи даты или времени счётчика.
+
+	Example:
+	session = Session.Session(protocol, cache=ReadCache.ReadCache())
+	session.read('60.01.04*FF')  # Модель счетчика: считывается один раз
+	"""
+
+	def __init__(self, ttls=None, clock=None):
+		"""ttls -- dict {TTL class: seconds} to override: STATIC - None (till invalidation),
+		DAILY - None (till the meter midnight less MeterClock margin), INSTANTANEOUS - 0 (not cached)
+		clock -- function() returns MeterClock.MeterClock of the meter, e.g. Session.clock (set by Session);
+		None - DAILY values are not cached till the meter midnight"""
+		self.ttls = {STATIC: None, DAILY: None, INSTANTANEOUS: 0}
+		if ttls is not None:
+			self.ttls.update(ttls)
+		self.clock = clock
+		self.items = {}  # Obis: (value, expiration time.monotonic() or None)
+		self.hits = 0
+		self.misses = 0
+
+	def _expiration(self, ttl_class):
+		"""Returns time.monotonic() of expiration, None - never, 0 - not cached"""
+		ttl = self.ttls[ttl_class]
+		if ttl is None and ttl_class == DAILY:
+			if self.clock is None:
+				return 0
+			clock = self.clock()
+			now = clock.now()
+			midnight = datetime.datetime.combine(now.date() + datetime.timedelta(days=1), datetime.time())
+			ttl = (midnight - now).total_seconds() - clock.margin
+			return time.monotonic() + ttl if ttl > 0 else 0
+		if ttl is None:
+			return None
+		return time.monotonic() + ttl if ttl > 0 else 0
+
+	def get(self, obis):
+		"""Returns cached value of OBIS code or None"""
+		item = self.items.get(Obis.Obis(obis))
+		if item is not None and (item[1] is None or time.monotonic() < item[1]):
+			self.hits += 1
+			return item[0]
+		self.misses += 1
+		return None
+
+	def put(self, obis, value):
+		obis = Obis.Obis(obis)
+		expiration = self._expiration(ttl_class_of(obis))
+		if expiration != 0:
+			self.items[obis] = (value, expiration)
+
+	def invalidate(self, obis=None):
+		"""Removes value of OBIS code, None - all values"""
+		if obis is None:
+			self.items.clear()
+		else:
+			self.items.pop(Obis.Obis(obis), None)
+
+	def __len__(self):
+		return len(self.items)
+
+
+register('60.01.00*FF', STATIC)  # ID счетчика
+register('60.01.01*FF', STATIC)  # Адрес счетчика
+register('60.01.04*FF', STATIC)  # Модель счетчика
+register('60.01.0A*FF', STATIC)  # Место установки
+register('0A.01.64*FF', STATIC)  # Суточное тарифное расписание
+register('0B.00.00*FF', STATIC)  # Годовое тарифное расписание
+register('0F.80.80*[01..7F]', DAILY)  # Энергия за прошедшие сутки
+register('63.01.00*[01..7F]', DAILY)  # Профиль прошедших суток
+register('0F.08.80*[01..0C]', DAILY)  # Энергия на начало прошедших месяцев (*00 -- текущий месяц)
@@ -0,0 +1,203 @@
+#!/usr/bin/env python2
+# coding: utf-8
+
+import threading
+import time
+
+from library import Mek61107, MeterClock, Obis, Snapshot, Tariffs
+
+
+class SessionError(Mek61107.Mek61107.Mek61107Exception):
+	pass
+
+
+class AccessDenied(SessionError):
+	def __str__(self):
+		return 'Access denied'
+
+
+class Session:
+	"""Сеанс работы со счётчиком: соединение (/?!, идентификационное сообщение, выбор опций)
+	и авторизация (P0/P1) выполняются один раз и поддерживаются между опросами; при
+	простое посылаются запросы поддержания сеанса. Повторное соединение выполняется
+	только после ошибки обмена или истечения времени бездействия счётчика.
+
+	Example:
+	from library import NevaMt3xx, Session
+	session = Session.Session(NevaMt3xx.NevaMt3xx_com(port), password='00000000')
+	session.start_keep_alive()
+	while True:
+		print(session.read('10.07.00*FF'))  # Активная мощность
+		time.sleep(10)
+	"""
+
+	KEEP_ALIVE_OBIS = Obis.Obis('00.09.02*FF')  # Дата: ГГММДД
+	CLOCK_OBIS = (Obis.Obis(MeterClock.DATE_OBIS), Obis.Obis(MeterClock.TIME_OBIS))
+	SCHEDULE_OBIS = tuple(map(Obis.Obis, Tariffs.SCHEDULE_OBIS))
+
+	def __init__(self, protocol, password='00000000', inactivity_timeout=60, keep_alive_interval=None, retries=1,
+			address='', logout_pause=.5, cache=None, schedules=None):
+		"""protocol -- NevaMt3xx_com or NevaMt3xx_tcp
+		address -- meter address on multi-drop bus, see NevaMt3xx.make_request
+		logout_pause -- see NevaMt3xx.logout
+		inactivity_timeout -- seconds, the meter closes the session after that time without exchange
+		keep_alive_interval -- seconds without exchange to send keep alive request; None - half of inactivity_timeout
+		retries -- count of re-connections after exchange error
+		cache -- ReadCache.ReadCache of read values, None - without cache
+		schedules -- Tariffs.TariffScheduleStore invalidated by W1 of tariff schedules, None - not used"""
+		self.protocol = protocol
+		self.password = password
+		self.inactivity_timeout = inactivity_timeout
+		self.keep_alive_interval = inactivity_timeout / 2 if keep_alive_interval is None else keep_alive_interval
+		self.retries = retries
+		self.address = address
+		self.logout_pause = logout_pause
+		self.company = None
+		self.device = None
+		self.is_open = False
+		self.last_exchange_time = 0.  # time.monotonic() of the last successful exchange
+		self.lock = threading.RLock()
+		self._keep_alive_stop = None
+		self._clock = None
+		self.cache = cache
+		if cache is not None and cache.clock is None:
+			cache.clock = self.clock  # values of the past days are kept till the meter midnight
+		self.schedules = schedules
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.stop_keep_alive()
+		self.close()
+
+	def idle_time(self):
+		return time.monotonic() - self.last_exchange_time
+
+	def open(self):
+		"""Connects & logins; raises AccessDenied"""
+		with self.lock:
+			self.is_open = False
+			self.company, self.device = self.protocol.connect(address=self.address)
+			if not self.protocol.login(self.password):
+				raise AccessDenied()
+			self.is_open = True
+			self.last_exchange_time = time.monotonic()
+
+	def close(self):
+		with self.lock:
+			if self.is_open:
+				self.is_open = False
+				self.protocol.logout(self.logout_pause)
+
+	def ensure(self):
+		"""Opens the session if it is not open or the meter already closed it by inactivity"""
+		with self.lock:
+			if not self.is_open or self.idle_time() >= self.inactivity_timeout:
+				self.open()
+
+	def exchange(self, cmd):
+		"""Sends Command and returns the answer; re-connects after exchange error"""
+		return self.exchange_command(cmd.command, cmd.data)
+
+	def exchange_command(self, command, data=''):
+		"""Sends command frame prebuilt by the frame cache and returns the answer;
+		re-connects after exchange error"""
+		with self.lock:
+			for retry in range(self.retries + 1):
+				try:
+					self.ensure()
+					self.protocol.send_command(command, data)
+					answer = self.protocol.receive()
+				except AccessDenied:
+					raise
+				except (OSError, Mek61107.Mek61107.Mek61107Exception):
+					if retry >= self.retries:
+						self.is_open = False
+						raise
+					answer = None
+				if answer is not None and (answer.is_message or answer.is_ack or answer.is_nak or answer.is_command):
+					self.last_exchange_time = time.monotonic()
+					return answer
+				self.is_open = False
+			raise SessionError('No answer: ' + command + '(' + data + ')')
+
+	def read(self, obis):
+		"""Returns value of OBIS code: Obis, '00.09.02*FF' or '000902FF'; from the cache if it is valid there"""
+		obis = Obis.Obis(obis)
+		if self.cache is not None:
+			value = self.cache.get(obis)
+			if value is not None:
+				return value
+		with self.lock:
+			cmd = self.exchange_command('R1', obis.read_data)
+			value = obis.value_of(cmd.data) if cmd.is_message else None
+			if value is None:
+				# a late answer of a former request: the answers are out of step, so the rest of
+				# the stream is dropped and the next request re-connects
+				self.is_open = False
+				self.protocol.parser.clear()
+				if not cmd.is_message:
+					raise SessionError('OBIS {} expected'.format(obis))
+				raise SessionError('Wrong OBIS, expected {}: {}'.format(obis, cmd.data))
+		if self.cache is not None:
+			self.cache.put(obis, value)
+		return value
+
+	def read_many(self, codes, decode=True):
+		"""Returns Snapshot.Snapshot of OBIS codes read in this session without interruption by other requests;
+		a failed code is kept in Snapshot.errors and the batch goes on; raises AccessDenied
+		decode -- decode values by ObisDecoders, False - values are texts"""
+		with self.lock:
+			self.ensure()
+			return Snapshot.read_many(self.read, codes, decode)
+
+	def write(self, obis, data):
+		obis = Obis.Obis(obis)
+		if self.cache is not None:
+			self.cache.invalidate(obis)
+		if self.schedules is not None and obis in self.SCHEDULE_OBIS:
+			self.schedules.invalidate()
+		cmd = self.exchange_command('W1', obis.wire + '(' + data + ')')
+		if obis in self.CLOCK_OBIS:
+			self._clock = None
+			if self.cache is not None:
+				self.cache.invalidate()  # the meter date may be changed
+		if cmd.is_message:
+			raise SessionError('Write OBIS {} error: {}'.format(obis, cmd.data))
+		if not cmd.is_ack:
+			raise SessionError('Write OBIS {} error'.format(obis))
+
+	def clock(self):
+		"""Returns MeterClock of the meter: date & time are read once per session object
+		and again only near the meter midnight or after date or time writing"""
+		if self._clock is None:
+			self._clock = MeterClock.MeterClock(self.read)
+		return self._clock
+
+	def keep_alive(self):
+		"""Sends keep alive request if the open session is idle for keep_alive_interval"""
+		with self.lock:
+			if self.is_open and self.keep_alive_interval <= self.idle_time() < self.inactivity_timeout:
+				try:
+					self.exchange_command('R1', self.KEEP_ALIVE_OBIS.read_data)
+				except (OSError, Mek61107.Mek61107.Mek61107Exception):
+					self.is_open = False  # re-connect by next request
+
+	def start_keep_alive(self):
+		"""Starts daemon thread calling keep_alive()"""
+		if self._keep_alive_stop is not None:
+			return
+		self._keep_alive_stop = threading.Event()
+		stop = self._keep_alive_stop
+
+		def run():
+			while not stop.wait(max(self.keep_alive_interval / 4, .1)):
+				self.keep_alive()
+
+		threading.Thread(target=run, name='Session keep alive', daemon=True).start()
+
+	def stop_keep_alive(self):
+		if self._keep_alive_stop is not None:
+			self._keep_alive_stop.set()
+			self._keep_alive_stop = None
@@ -0,0 +1,84 @@
+#!/usr/bin/env python2
+# coding: utf-8
+
+import time
+
+from library import Mek61107, Obis, ObisDecoders
+
+
+class Snapshot:
+	"""Результат пакетного считывания OBIS кодов (read_many): декодированные значения (ObisDecoders),
+	исходные тексты, ошибки и время считывания каждого кода; ошибка одного кода не прерывает пакет.
+
+	Example:
+	snapshot = session.read_many(['60.01.04*FF', '10.07.00*FF', '0C.07.00*FF'])
+	if snapshot.ok:
+		print(snapshot['10.07.00*FF'], snapshot.real('0C.07.00*FF'))
+	for obis, error in snapshot.errors.items():
+		print(obis, error)
+	"""
+
+	__slots__ = ('codes', 'values', 'raw', 'errors', 'timings', 'time')
+
+	def __init__(self):
+		self.codes = []  # Obis in request order
+		self.values = {}  # Obis: decoded value
+		self.raw = {}  # Obis: value text
+		self.errors = {}  # Obis: exception
+		self.timings = {}  # Obis: seconds
+		self.time = 0.  # seconds, the whole batch
+
+	@property
+	def ok(self):
+		return not self.errors
+
+	def __getitem__(self, obis):
+		"""Returns decoded value; raises the read error of the code"""
+		obis = Obis.Obis(obis)
+		error = self.errors.get(obis)
+		if error is not None:
+			raise error
+		return self.values[obis]
+
+	def get(self, obis, default=None):
+		return self.values.get(Obis.Obis(obis), default)
+
+	def real(self, obis, default=None):
+		"""Returns float (tuple of floats) of fixed-point value, number or text, see ObisDecoders.real"""
+		obis = Obis.Obis(obis)
+		raw = self.raw.get(obis)
+		return default if raw is None else ObisDecoders.real(obis, raw)
+
+	def __contains__(self, obis):
+		return Obis.Obis(obis) in self.values
+
+	def __iter__(self):
+		return iter(self.codes)
+
+	def __len__(self):
+		return len(self.codes)
+
+	def __str__(self):
+		return '\n'.join('{}: {} ({:.3f} s)'.format(obis, self.errors[obis] if obis in self.errors else self.raw[obis],
+			self.timings[obis]) for obis in self.codes)
+
+
+def read_many(read, codes, decode=True):
+	"""Returns Snapshot of OBIS codes read one by one by read(obis) -> value text, e.g. Session.read;
+	duplicated codes are read once; exchange (OSError, Mek61107Exception) and decoding errors
+	are kept in Snapshot.errors
+	decode -- decode values by ObisDecoders, False - values are texts"""
+	ret = Snapshot()
+	batch_start = time.perf_counter()
+	for obis in dict.fromkeys(Obis.Obis(code) for code in codes):
+		ret.codes.append(obis)
+		start = time.perf_counter()
+		try:
+			raw = read(obis)
+			ret.raw[obis] = raw
+			ret.values[obis] = ObisDecoders.decode(obis, raw) if decode else raw
+		except (OSError, Mek61107.Mek61107.Mek61107Exception, ObisDecoders.WrongValue) as e:
+			ret.errors[obis] = e
+		ret.timings[obis] = time.perf_counter() - start
+	ret.time = time.perf_counter() - batch_start
+	return ret
@@ -0,0 +1,110 @@
+#!/usr/bin/env python2
+# coding: utf-8
+
+from array import array
+from collections import OrderedDict
+import datetime
+import os
+import zlib
+
+from library import ColumnStore, HalfHours, Tariffs
+
+
+class TariffCache:
+	"""Кэш рассчитанных по тарифам суток (Tariffs.allocate_day): ключ -- (счётчик, дата, версия
+	тарифного расписания), значение сохраняется вместе с контрольной суммой исходных данных суток,
+	поэтому сутки пересчитываются только при изменении профиля или энергий за сутки; текущие
+	(неполные) сутки не сохраняются. Хранится в колонках path/<meter>/tariffs_<version>.col;
+	вытеснение: не более max_versions расписаний на счётчик (старые файлы удаляются) и не более
+	max_open открытых колонок.
+
+	Example:
+	cache = TariffCache.TariffCache('archive')
+	totals = cache.allocate(meter_id, store, schedule, date.today(), 60)
+	"""
+
+	WIDTH = HalfHours.TARIFFS * HalfHours.HALF_HOURS + 1  # values & inputs checksum
+	RESERVE = 128  # days before the first cached day
+
+	def __init__(self, path, max_versions=2, max_open=64):
+		self.path = path
+		self.max_versions = max_versions
+		self.max_open = max_open
+		self.columns = OrderedDict()  # (meter, version): ColumnStore.Column, least recently used first
+		self.hits = 0
+		self.misses = 0
+
+	def _meter_path(self, meter):
+		return os.path.join(self.path, str(meter).replace(os.sep, '_') or '_')
+
+	def _column(self, meter, version, index):
+		key = (meter, version)
+		column = self.columns.get(key)
+		if column is not None:
+			self.columns.move_to_end(key)
+			return column
+		path = os.path.join(self._meter_path(meter), 'tariffs_{:08X}.col'.format(version))
+		is_new = not os.path.exists(path)
+		column = ColumnStore.Column(path, 'q', self.WIDTH, index - self.RESERVE)
+		os.utime(path)  # recently used version
+		self.columns[key] = column
+		if is_new:
+			self._evict_versions(meter)
+		while len(self.columns) > self.max_open:
+			self.columns.popitem(last=False)[1].close()
+		return column
+
+	def _evict_versions(self, meter):
+		directory = self._meter_path(meter)
+		paths = [os.path.join(directory, name) for name in os.listdir(directory)
+			if name.startswith('tariffs_') and name.endswith('.col')]
+		paths.sort(key=os.path.getmtime, reverse=True)
+		for path in paths[self.max_versions:]:
+			for key, column in list(self.columns.items()):
+				if column.path == path:
+					del self.columns[key]
+					column.close()
+			os.remove(path)
+
+	def close(self):
+		for column in self.columns.values():
+			column.close()
+		self.columns.clear()
+
+	@staticmethod
+	def checksum(day_totals, day):
+		return zlib.crc32(array('q', day_totals).tobytes() + array('i', day).tobytes())
+
+	def day(self, meter, date, day_totals, day, schedule, complete=True):
+		"""Returns array of date half hours cumulative energies [sum, T1, T2, T3, T4]*48, Wh:
+		from the cache or calculated by Tariffs.allocate_day & cached if the day is complete
+		schedule -- Tariffs.TariffSchedule"""
+		index = date.toordinal()
+		checksum = self.checksum(day_totals, day)
+		column = self._column(meter, schedule.version, index)
+		record = column.get(index)
+		if record is not None and record[0][-1] == checksum:
+			self.hits += 1
+			return array('q', record[0][:-1])
+		self.misses += 1
+		ret = Tariffs.allocate_day(day_totals, day, schedule(date))
+		if complete:
+			column.put(index, ret + array('q', (checksum,)))
+		return ret
+
+	def allocate(self, meter, store, schedule, last_date, days):
+		"""Returns HalfHours.TariffTotals of days from last_date backwards calculated from the archive
+		with the cache; raises KeyError if a day is not in the archive
+		store -- ColumnStore.ColumnStore
+		schedule -- Tariffs.TariffSchedule"""
+		ret = HalfHours.TariffTotals(last_date)
+		for days_ago in range(days):
+			date = last_date - datetime.timedelta(days=days_ago)
+			day = store.get_day(meter, date)
+			if day is None:
+				raise KeyError('{}: {} is not in the archive'.format(meter, date))
+			profile, day_totals, complete = day
+			ret.append(self.day(meter, date, day_totals, profile, schedule, complete))
+		for column in self.columns.values():
+			column.flush()
+		return ret
@@ -0,0 +1,226 @@
+#!/usr/bin/env python2
+# coding: utf-8
+
+from array import array
+import datetime
+from itertools import accumulate, repeat
+import json
+from operator import mul, rshift
+import os
+import time
+import zlib
+
+from library import HalfHours
+
+TARIFFS_COUNT = 4  # T1..T4
+ORDINARY_DAY = 0x7F  # тариф дня годового расписания: обычный день
+DAY_SCHEDULE_OBIS = '0A.01.64*FF'  # Суточное тарифное расписание
+YEAR_SCHEDULE_OBIS = '0B.00.00*FF'  # Годовое тарифное расписание
+SCHEDULE_OBIS = (DAY_SCHEDULE_OBIS, YEAR_SCHEDULE_OBIS)
+
+
+def day_tariff_indexes(day_tariffs_schedule):
+	"""Returns list of 48 (one per half hour) tariff indexes of day schedule (0A.01.64*FF):
+	['ЧЧММTT', ...]; empty (000000) items are ignored; before the first switch the last tariff acts"""
+	schedule = sorted(item for item in day_tariffs_schedule if int(item, 16) != 0)
+	if not schedule:
+		return [1] * HalfHours.HALF_HOURS
+	ret = []
+	tariff = int(schedule[-1][-2:])
+	switch_index = 0
+	for half_hour in range(HalfHours.HALF_HOURS):
+		minutes = half_hour * 30
+		slot = '{:02}{:02}'.format(minutes // 60, minutes % 60)
+		while switch_index < len(schedule) and schedule[switch_index][:4] <= slot:
+			tariff = int(schedule[switch_index][-2:])
+			switch_index += 1
+		ret.append(tariff)
+	return ret
+
+
+def year_special_days(year_tariffs_schedule):
+	"""Returns dict of special days of year schedule (0B.00.00*FF): ['ММДДTT', ...] -> {'ММДД': tariff};
+	empty (000000) items & ordinary days (TT = 7F) are ignored"""
+	ret = {}
+	for item in year_tariffs_schedule:
+		if int(item, 16) != 0 and int(item[-2:], 16) != ORDINARY_DAY:
+			ret[item[:4]] = int(item[-2:])
+	return ret
+
+
+class DayMask:
+	"""Тарифная маска суток: тариф каждого из 48 получасов и селекторы 0/1 получасов каждого тарифа;
+	маски интернируются (одна на набор тарифов)"""
+
+	__slots__ = ('tariffs', 'selectors')
+
+	_masks = {}
+
+	def __init__(self, tariffs):
+		tariffs = tuple(tariffs)
+		if len(tariffs) != HalfHours.HALF_HOURS:
+			raise ValueError('{} tariff indexes expected: {}'.format(HalfHours.HALF_HOURS, len(tariffs)))
+		for tariff in tariffs:
+			if not 0 < tariff <= TARIFFS_COUNT:
+				raise ValueError('Tariff index out of range (1..{}): {}'.format(TARIFFS_COUNT, tariff))
+		self.tariffs = tariffs
+		self.selectors = tuple(tuple(int(t == tariff) for t in tariffs) for tariff in range(1, TARIFFS_COUNT + 1))
+
+	@classmethod
+	def of(cls, tariffs):
+		tariffs = tuple(tariffs)
+		mask = cls._masks.get(tariffs)
+		if mask is None:
+			mask = cls._masks[tariffs] = cls(tariffs)
+		return mask
+
+	@classmethod
+	def single(cls, tariff):
+		"""Returns mask of the whole day with one tariff"""
+		return cls.of((tariff,) * HalfHours.HALF_HOURS)
+
+
+class TariffSchedule:
+	"""Тарифное расписание счётчика (0A.01.64*FF -- суточное, 0B.00.00*FF -- годовое):
+	разбирается один раз в словарь 'ММДД' -> DayMask для всех дней (високосного) года.
+	version -- контрольная сумма исходных расписаний, меняется только при изменении расписания.
+	Экземпляр -- функция(date) -> DayMask для allocate.
+
+	Example:
+	schedule = Tariffs.TariffSchedule(read_obis(protocol, '0A.01.64*FF').split(','),
+		read_obis(protocol, '0B.00.00*FF').split(','))
+	totals = Tariffs.allocate(profile, day_totals, schedule)
+	"""
+
+	__slots__ = ('day_schedule', 'year_schedule', 'version', 'days')
+
+	def __init__(self, day_tariffs_schedule, year_tariffs_schedule=()):
+		self.day_schedule = tuple(day_tariffs_schedule)
+		self.year_schedule = tuple(year_tariffs_schedule)
+		self.version = zlib.crc32(';'.join((','.join(self.day_schedule), ','.join(self.year_schedule))).encode())
+		ordinary = DayMask.of(day_tariff_indexes(self.day_schedule))
+		special = year_special_days(self.year_schedule)
+		self.days = {}
+		date = datetime.date(2000, 1, 1)  # leap year: all days
+		while date.year == 2000:
+			day = '{:02}{:02}'.format(date.month, date.day)
+			self.days[day] = DayMask.single(special[day]) if day in special else ordinary
+			date += datetime.timedelta(days=1)
+
+	def mask(self, date):
+		return self.days['{:02}{:02}'.format(date.month, date.day)]
+
+	__call__ = mask
+
+	def tariffs(self, date):
+		"""Returns tuple of 48 half hours tariff indexes of date"""
+		return self.mask(date).tariffs
+
+	def __eq__(self, other):
+		return isinstance(other, TariffSchedule) and self.version == other.version and \
+			self.day_schedule == other.day_schedule and self.year_schedule == other.year_schedule
+
+	def __hash__(self):
+		return self.version
+
+	def __repr__(self):
+		return 'TariffSchedule(version={:08X})'.format(self.version)
+
+
+def schedule_masks(day_tariffs_schedule, year_tariffs_schedule=()):
+	"""Returns function(date) -> DayMask of meter tariff schedules (0A.01.64*FF & 0B.00.00*FF):
+	special day -- all day half hours as one tariff"""
+	return TariffSchedule(day_tariffs_schedule, year_tariffs_schedule)
+
+
+class TariffScheduleStore:
+	"""Кэш тарифных расписаний счётчиков (в памяти и в файле JSON): расписание считывается
+	со счётчика один раз и перечитывается только после invalidate() или по истечении max_age секунд
+	(None -- никогда). Запись W1 расписаний (SCHEDULE_OBIS) через Session.Session(schedules=store)
+	вызывает invalidate() автоматически.
+
+	Example:
+	store = Tariffs.TariffScheduleStore('tariff_schedules.json')
+	schedule = store.get(meter_id, lambda: (read_obis(protocol, '0A.01.64*FF').split(','),
+		read_obis(protocol, '0B.00.00*FF').split(',')))
+	"""
+
+	def __init__(self, path=None, max_age=None):
+		"""path -- JSON file, None - memory only"""
+		self.path = path
+		self.max_age = max_age
+		self.items = {}  # key: (TariffSchedule, read time)
+		if path is not None and os.path.exists(path):
+			with open(path) as f:
+				for key, item in json.load(f).items():
+					self.items[key] = (TariffSchedule(item['day'], item['year']), item['time'])
+
+	def get(self, key, read):
+		"""Returns cached schedule of meter key or reads it by read() -> (day schedule, year schedule)"""
+		item = self.items.get(key)
+		if item is not None and (self.max_age is None or time.time() - item[1] < self.max_age):
+			return item[0]
+		schedule = TariffSchedule(*read())
+		if item is not None and item[0] == schedule:
+			schedule = item[0]  # not changed: keep precomputed days
+		self.put(key, schedule)
+		return schedule
+
+	def put(self, key, schedule):
+		self.items[key] = (schedule, time.time())
+		self.save()
+
+	def invalidate(self, key=None):
+		"""Forgets schedule of meter key, None - all"""
+		if key is None:
+			self.items.clear()
+		else:
+			self.items.pop(key, None)
+		self.save()
+
+	def save(self):
+		if self.path is None:
+			return
+		data = {key: {'day': list(schedule.day_schedule), 'year': list(schedule.year_schedule), 'time': read_time}
+			for key, (schedule, read_time) in self.items.items()}
+		with open(self.path + '.tmp', 'w') as f:
+			json.dump(data, f, indent=1)
+		os.replace(self.path + '.tmp', self.path)
+
+
+def allocate_day(day_totals, day, mask):
+	"""Returns array of 48 half hours cumulative energies [sum, T1, T2, T3, T4]*48, Wh
+	day_totals -- day start energies [sum, T1, T2, T3, T4], Wh (0F.80.80*ДД)
+	day -- 48 half hour powers, W (63.01.00*ДД): half hour energy = W / 2
+	mask -- DayMask"""
+	if len(day) != HalfHours.HALF_HOURS:
+		raise ValueError('{} half hours expected: {}'.format(HalfHours.HALF_HOURS, len(day)))
+	ret = array('q', bytes(HalfHours.TARIFFS * HalfHours.HALF_HOURS * 8))
+	# cumulative sums in 1/2 Wh, then >> 1
+	ret[0::HalfHours.TARIFFS] = array('q', map(rshift, accumulate(day, initial=day_totals[0] * 2), repeat(1)))[1:]
+	for tariff, selector in enumerate(mask.selectors, 1):
+		ret[tariff::HalfHours.TARIFFS] = array('q', map(rshift, accumulate(map(mul, day, selector),
+			initial=day_totals[tariff] * 2), repeat(1)))[1:]
+	return ret
+
+
+def allocate(profile, day_totals, masks):
+	"""Returns HalfHours.TariffTotals of all days of the profile without meter connection
+	profile -- HalfHours.HalfHourProfile
+	day_totals -- sequence of day start energies [sum, T1, T2, T3, T4] per profile day, Wh
+	masks -- function(date) -> DayMask, e.g. schedule_masks(...), or DayMask of every day"""
+	if len(day_totals) != len(profile):
+		raise ValueError('Day totals count {} differs from profile days count {}'.format(len(day_totals), len(profile)))
+	ret = HalfHours.TariffTotals(profile.base_date)
+	for i, (totals, day) in enumerate(zip(day_totals, profile)):
+		ret.append(allocate_day(totals, day, masks if isinstance(masks, DayMask) else masks(profile.date(i))))
+	return ret
+
+
+def allocate_many(meters, masks):
+	"""Recalculates many meters offline, e.g. after a tariff change
+	meters -- dict {key: (HalfHourProfile, day totals)}
+	masks -- function(date) -> DayMask for all meters or dict {key: function(date) -> DayMask}
+	returns dict {key: HalfHours.TariffTotals}"""
+	return {key: allocate(profile, day_totals, masks[key] if isinstance(masks, dict) else masks)
+		for key, (profile, day_totals) in meters.items()}
@@ -2,7 +2,7 @@ import os
 import time
 # for using serial port
 # import serial
-from library import NevaMt3xx
+from library import NevaMt3xx, Obis, ObisDecoders, Session
 # import paho.mqtt.client as mqtt
 # for using TCP connection
 import socket
@@ -35,78 +35,52 @@ protocol = NevaMt3xx.NevaMt3xx_tcp(connection)
 result = {}
 
 # connect & login
-print('SEND: /?!\\r\\n')
-company, device = protocol.connect()
-cmd = protocol.receive()
-print('RCV:' + str(cmd))
-print(company, device)
-if not cmd.is_command or cmd.command != 'P0':
-    raise Exception('Command "P0" expected')
+session = Session.Session(protocol, password='00000000')
+session.open()
+print(session.company, session.device)
 
-result['Vendor'] = company
-result['Model'] = device
-
-password = '00000000'
-protocol.send(NevaMt3xx.NevaMt3xx.Command('P1', '(' + password + ')'))
-cmd = protocol.receive()
-print('RCV:' + str(cmd))
-
-if not cmd.is_ack:
-    raise Exception('Access denied')
+result['Vendor'] = session.company
+result['Model'] = session.device
 
 obis_str = {
-    'Date': '00.09.02*FF',  # Дата: ГГММДД
-    'Time': '00.09.01*FF',
-    'Version': '60.01.04*FF',
-    'Address': '60.01.01*FF',
-    'Point': '60.01.0A*FF',  # Точка учёта
+    'Date': Obis.Obis('00.09.02*FF'),  # Дата: ГГММДД
+    'Time': Obis.Obis('00.09.01*FF'),
+    'Version': Obis.Obis('60.01.04*FF'),
+    'Address': Obis.Obis('60.01.01*FF'),
+    'Point': Obis.Obis('60.01.0A*FF'),  # Точка учёта
 }
 
 obis_values = {
-    'Voltage': '0C.07.00*FF',  # Напряжение по сумме фаз
-    'Current': '0B.07.00*FF',  # Ток по сумме фаз
-    'Active_Power': '10.07.00*FF',  # Активная мощность
-    'Freq': '0E.07.01*FF',
-    'Temp': '60.09.00*FF',
-    'KPower': '0D.07.FF*FF',  # Коэффициент активной мощности
-    'T': '0F.08.80*FF',  # Значение счётчиков по всем тарифам начиная с общего
+    'Voltage': Obis.Obis('0C.07.00*FF'),  # Напряжение по сумме фаз
+    'Current': Obis.Obis('0B.07.00*FF'),  # Ток по сумме фаз
+    'Active_Power': Obis.Obis('10.07.00*FF'),  # Активная мощность
+    'Freq': Obis.Obis('0E.07.01*FF'),
+    'Temp': Obis.Obis('60.09.00*FF'),
+    'KPower': Obis.Obis('0D.07.FF*FF'),  # Коэффициент активной мощности
+    'T': Obis.Obis('0F.08.80*FF'),  # Значение счётчиков по всем тарифам начиная с общего
 }
 
-table = str.maketrans("", "", '.*')
-
-for key, value in obis_str.items():
-    value = value.translate(table) + '()'
-    print('SEND:' + key)
-    protocol.send(NevaMt3xx.NevaMt3xx.Command('R1', value))
-    cmd = protocol.receive()
-    print('RCV:' + str(cmd))
-    if not cmd.is_message:
-        raise Exception('OBIS 000902FF expected')
-    data = str(cmd.data[8:].strip('()'))
-    result[key] = data
-
-
-def ltrim_value(s: str) -> str:
-    while len(s) > 2 and s[0] == '0' and s[1] != '.':
-        s = s[1:]
-    return s
-
-
-for key, value in obis_values.items():
-    value = value.translate(table) + '()'
-    print('SEND:' + key)
-    protocol.send(NevaMt3xx.NevaMt3xx.Command('R1', value))
-    cmd = protocol.receive()
-    print('RCV:' + str(cmd))
-    if not cmd.is_message:
-        raise Exception('OBIS 000902FF expected')
-    data = ltrim_value(str(cmd.data[8:].strip('()')))
-    if ',' in data:
-        data = [ltrim_value(d) for d in data.split(',')]
-        for i, d in enumerate(data):
-            result[key + str(i)] = d
+snapshot = session.read_many(list(obis_str.values()) + list(obis_values.values()))
+for obis, error in snapshot.errors.items():
+    print('ERROR {}: {}'.format(obis, error))
+print('{} OBIS in {:.3f} s'.format(len(snapshot), snapshot.time))
+
+for key, obis in obis_str.items():
+    if obis in snapshot.raw:
+        result[key] = snapshot.raw[obis]
+
+for key, obis in obis_values.items():
+    if obis not in snapshot:
+        continue
+    decoder = ObisDecoders.decoder_of(obis)
+    values = snapshot[obis]
+    if decoder.count is None:
+        result[key] = decoder.format(values)
+    elif len(values) > 1:
+        for i, value in enumerate(values):
+            result[key + str(i)] = decoder.format(value)
     else:
-        result[key] = data
+        result[key] = decoder.format(values[0])
 
 
 def on_log(client_instance, userdata, level, buff):
@@ -131,7 +105,7 @@ except Exception as e:
 '''
 
 # logout
-protocol.send(NevaMt3xx.NevaMt3xx.Command('B0', ''))
+session.close()
 
 # try:
 
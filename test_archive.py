@@ -0,0 +1,127 @@
+#!/usr/bin/env python2
+# -*- coding: UTF-8 -*-
+
+# Проверка возобновляемой синхронизации архива (Archive.ArchiveSync.resume) без счётчика:
+# python test_archive.py или python -m pytest test_archive.py
+
+import datetime
+import shutil
+import tempfile
+
+from library import Archive, ColumnStore, MeterClock, Obis, Session
+
+METER_DATE = datetime.date(2024, 3, 10)
+
+
+class FakeMeter:
+    '''answers R1 of date, time & day archives; the request number fail_at raises SessionError as read_obis does'''
+
+    def __init__(self, fail_at=None):
+        self.fail_at = fail_at
+        self.requests = []  # read Obis
+
+    def read(self, obis):
+        obis = Obis.Obis(obis)
+        self.requests.append(obis)
+        if len(self.requests) == self.fail_at:
+            raise Session.SessionError('OBIS {} expected'.format(obis))
+        if obis == Obis.Obis(MeterClock.DATE_OBIS):
+            return METER_DATE.strftime('%y%m%d')
+        if obis == Obis.Obis(MeterClock.TIME_OBIS):
+            return '120000'
+        days_ago = obis.groups[-1]
+        if obis in Archive.DAY_TOTALS_OBIS:
+            return ','.join(['{:05}.000'.format(1000 - days_ago)] * 5)
+        if obis in Archive.PROFILE_OBIS:
+            return ','.join([str(days_ago)] * 48)
+        raise Session.SessionError('Unknown OBIS {}'.format(obis))
+
+
+def archive_requests(meter):
+    return [obis for obis in meter.requests if obis in Archive.DAY_TOTALS_OBIS or obis in Archive.PROFILE_OBIS]
+
+
+def test_resume_after_read_error():
+    path = tempfile.mkdtemp()
+    try:
+        meter = FakeMeter()
+        store = ColumnStore.ColumnStore(path)
+        sync = Archive.ArchiveSync(store, 'm', meter.read)
+        sync.clock.sync()
+        # the 3rd day totals read fails: the first 2 days are stored already
+        meter.fail_at = len(meter.requests) + 5
+        reconnects = []
+        dates = sync.resume(depth=5, reconnect=lambda: reconnects.append(1), retries=3)
+
+        assert reconnects == [1]
+        assert dates == [METER_DATE - datetime.timedelta(days=days_ago) for days_ago in range(5, -1, -1)]
+        requests = archive_requests(meter)
+        # every day is read once besides the failed request
+        assert len(requests) == 2 * 6 + 1
+        assert requests.count(Archive.DAY_TOTALS_OBIS[3]) == 2
+        assert all(requests.count(obis) == 1 for obis in set(requests) if obis != Archive.DAY_TOTALS_OBIS[3])
+        assert store.watermark('m') == METER_DATE - datetime.timedelta(days=1)
+        for days_ago in range(1, 6):
+            date = METER_DATE - datetime.timedelta(days=days_ago)
+            assert store.is_complete('m', date)
+            profile, totals, complete = store.get_day('m', date)
+            assert profile == (days_ago,) * 48 and totals == ((1000 - days_ago) * 1000,) * 5
+        assert not store.is_complete('m', METER_DATE)
+        store.close()
+
+        # the next run reads the current day only
+        meter = FakeMeter()
+        store = ColumnStore.ColumnStore(path)
+        sync = Archive.ArchiveSync(store, 'm', meter.read)
+        assert sync.resume(depth=5) == [METER_DATE]
+        assert archive_requests(meter) == [Archive.DAY_TOTALS_OBIS[0], Archive.PROFILE_OBIS[0]]
+        store.close()
+    finally:
+        shutil.rmtree(path)
+
+
+def test_resume_gives_up_after_retries():
+    path = tempfile.mkdtemp()
+    try:
+        meter = FakeMeter()
+        sync = Archive.ArchiveSync(ColumnStore.ColumnStore(path), 'm', lambda obis: meter.read('00.00.00*FF'))
+        try:
+            sync.resume(depth=5, reconnect=lambda: None, retries=2)
+        except Session.SessionError:
+            pass
+        else:
+            raise AssertionError('SessionError expected')
+        sync.store.close()
+    finally:
+        shutil.rmtree(path)
+
+
+def test_resume_raises_other_errors_at_once():
+    path = tempfile.mkdtemp()
+    try:
+        meter = FakeMeter()
+
+        def read(obis):
+            if Obis.Obis(obis) in Archive.DAY_TOTALS_OBIS:
+                raise ValueError(obis)
+            return meter.read(obis)
+
+        sync = Archive.ArchiveSync(ColumnStore.ColumnStore(path), 'm', read)
+        reconnects = []
+        try:
+            sync.resume(depth=5, reconnect=lambda: reconnects.append(1), retries=2)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError('ValueError expected')
+        assert reconnects == []
+        sync.store.close()
+    finally:
+        shutil.rmtree(path)
+
+
+if __name__ == '__main__':
+    test_resume_after_read_error()
+    test_resume_gives_up_after_retries()
+    test_resume_raises_other_errors_at_once()
+    print('ok')
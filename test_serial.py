@@ -5,11 +5,11 @@ import argparse
 import socket
 import serial
 import sys
-import time
 import traceback
 from datetime import datetime, timedelta
 
-from library import NevaMt3xx
+from library import Archive, ColumnStore, Exporters, HalfHours, MeterClock, NevaMt3xx, Obis, ObisDecoders, Session, Snapshot, \
+    TariffCache, Tariffs
 
 VERBOSE_LEVEL = 1
 
@@ -55,24 +55,56 @@ class log:
 
 DEFAULT_COM_PORT = 'COM1' if sys.platform.startswith('win') else 'ttyUSB0'
 DEFAULT_PASSWORD = '00000000'
+# Профиль нагрузки активной энергии получасовой: Х.Х.ХХ,...,Х.Х.ХХ (кВт, по 48 параметров: первые..последние 30 минут)
+HALF_HOURS_OBIS = Obis.ObisRange('63.01.00*[00..7F]')
+# Активная энергия за сутки по тарифам: XXXXX.X.XX,...,ХХХХХ.Х.ХХ (кВт/ч, по 5 параметров: Т0-суммарный тариф,Т1,Т2,Т3,Т4)
+DAY_TARIFFS_OBIS = Obis.ObisRange('0F.80.80*[00..7F]')
+# Активная энергия нарастающим итогом: XXXXX.X.XX,...,ХХХХХ.Х.ХХ (кВт/ч, по 5 параметров: параметров энергия Т0-суммарный тариф,Т1,Т2,Т3,Т4)
+MONTHS_OBIS = Obis.ObisRange('0F.08.80*[00..0C]')
+DAY_READ_DURATION = 10.  # seconds, reading of the day profile & the day tariffs energies
 
 def pase_args():
     parser = argparse.ArgumentParser(description=u'Программирование счётчика электроэнергии типа НЕВА МТ 3xx.',
                                      formatter_class=argparse.RawTextHelpFormatter)
     parser.add_argument('-p', '--port', metavar='COM_PORT', default=DEFAULT_COM_PORT,
                         help=u'com порт для работы со счётчиком; по умолчанию: ' + str(DEFAULT_COM_PORT) + '\n' + u'порт для TCP сервера задается в формате :ХХХХХ, где ХХХХХ - номер порта')
+    parser.add_argument('-a', '--address', metavar='ADDRESS', default='',
+                        help=u'адрес счётчика на шине RS485; по умолчанию: "" - любой счётчик')
     parser.add_argument('--password', metavar='PASSWORD', default=DEFAULT_PASSWORD,
                         help=u'пароль для работы со счётчиком; по умолчанию: "' + str(DEFAULT_PASSWORD) + '"')
     parser.add_argument('--obis', metavar='OBIS', nargs='*',
                         help=u'OBIS код для передачи счётчику; например, дата: ГГММДД: "00.09.02*FF"')
     parser.add_argument('-i', '--id', action='store_true', help=u'показать идентификатор счётчика')
+    parser.add_argument('-r', '--readout', action='store_true',
+                        help=u'считать блок данных счётчика в режиме считывания данных (y=0) без пароля')
     parser.add_argument('--half-hours', metavar='DAYS_AGO', type=int,
                         help=u'считать получасовой профайл глубиной дней: 0..127')
     parser.add_argument('--calc-half-hours', metavar='DAYS_AGO', type=int,
                         help=u'считать получасовой профайл и рассчитать по тарифам глубиной дней: 0..127')
+    parser.add_argument('--format', choices=['text', 'csv', 'jsonl', 'columnar'], default='text',
+                        help=u'формат вывода --half-hours и --calc-half-hours: text - таблица по суткам;\n'
+                             u'csv, jsonl (JSON Lines), columnar (двоичный поколоночный) - потоковая выгрузка\n'
+                             u'строк: счётчик, время получаса, W или Wh по тарифам; по умолчанию: text')
+    parser.add_argument('--output', metavar='FILE', default='-',
+                        help=u'файл вывода --format csv, jsonl или columnar; по умолчанию: "-" - стандартный вывод')
+    parser.add_argument('--archive', metavar='DIR',
+                        help=u'каталог локального архива (колонки в файлах, отображаемых в память) профилей, суточных\n'
+                             u'и месячных энергий; --half-hours и --calc-half-hours\n'
+                             u'считывают со счётчика только сутки, которых нет в архиве, и текущие сутки')
+    parser.add_argument('--sync', metavar='DAYS_AGO', type=int,
+                        help=u'синхронизировать локальный архив (--archive) глубиной дней: 0..127 и энергии на начало месяцев')
+    parser.add_argument('--retries', metavar='COUNT', type=int, default=3,
+                        help=u'количество повторных подключений при ошибке связи во время считывания архива\n'
+                             u'(--archive); считанные сутки сохраняются, считывание продолжается с первых\n'
+                             u'отсутствующих суток; по умолчанию: 3')
+    parser.add_argument('--schedule-cache', metavar='FILE',
+                        help=u'файл кэша тарифных расписаний счётчиков (JSON) для --calc-half-hours;\n'
+                             u'расписание перечитывается со счётчика только при отсутствии в кэше')
     parser.add_argument('-v', action='count', default=0,
                         help='verbose level: -v, -vv or -vvv (bytes); по умолчанию: -v')
     args = parser.parse_args()
+    if args.format == 'text' and args.output != '-':
+        parser.error('--output requires --format csv, jsonl or columnar')
     if VERBOSE_LEVEL > 0:
         dump('arguments:')
     for attribute, value in sorted(args.__dict__.items()):
@@ -90,7 +122,7 @@ def connect(protocol):
     global VERBOSE_LEVEL
     dump('Connect')
     VERBOSE_LEVEL += 1
-    company, device = protocol.connect()
+    company, device = protocol.connect(address=args.address)
     VERBOSE_LEVEL -= 1
     if args.id:
         print('{}\n{}'.format(company, device))
@@ -98,55 +130,67 @@ def connect(protocol):
     return company, device
 
 
+def readout(protocol):
+    global VERBOSE_LEVEL
+    dump('Readout')
+    VERBOSE_LEVEL += 1
+    for address, value in protocol.iter_readout(address=args.address):
+        print(address + '(' + (value if type(value) is str else ')('.join(value)) + ')')
+    VERBOSE_LEVEL -= 1
+    dump('done')
+
+
 def login(protocol, password):
     global VERBOSE_LEVEL
     dump('Login')
     VERBOSE_LEVEL += 1
-    cmd = protocol.receive()
-    if not cmd.is_command or cmd.command != 'P0':
-        raise Exception('Command "P0" expected')
-    protocol.send(NevaMt3xx.NevaMt3xx.Command('P1', '(' + password + ')'))
-    cmd = protocol.receive()
+    is_ack = protocol.login(password)
     VERBOSE_LEVEL -= 1
-    dump('done' if cmd.is_ack else 'FAIL')
-    return cmd.is_ack
+    dump('done' if is_ack else 'FAIL')
+    return is_ack
 
 
 def logout(protocol):
     dump('Logout')
     global VERBOSE_LEVEL
     VERBOSE_LEVEL += 1
-    protocol.send(NevaMt3xx.NevaMt3xx.Command('B0', ''))
-    time.sleep(.5)
-    protocol.send(NevaMt3xx.NevaMt3xx.Command('B0', ''))
+    protocol.logout()
     VERBOSE_LEVEL -= 1
     dump('done')
 
 
 def read_obis(protocol, obis):
-    dump('OBIS ' + obis)
-    obis = obis.replace('.', '').replace('*', '')
-    print('obis=' + str(obis))
+    obis = Obis.Obis(obis)
+    dump('OBIS ' + obis.display)
+    dump('obis=' + obis.wire, 1)
     global VERBOSE_LEVEL
     VERBOSE_LEVEL += 1
-    protocol.send(NevaMt3xx.NevaMt3xx.Command('R1', obis + '()'))
-    cmd = protocol.receive()
-    print('cmd.data=' + str(cmd.data))
-    if not cmd.is_message:
-        raise Exception('OBIS {} expected'.format(obis))
-    if not cmd.data.startswith(obis + '('):
-        raise Exception('Wrong OBIS, expected {}: {}'.format(obis, cmd.data))
-    VERBOSE_LEVEL -= 1
-    dump(cmd.data[len(obis):].strip('()'))
-    return cmd.data[len(obis):].strip('()')
+    try:
+        protocol.send_command('R1', obis.read_data)
+        cmd = protocol.receive()
+        if cmd.is_message:
+            dump('cmd.data=' + str(cmd.data), 1)
+        value = obis.value_of(cmd.data) if cmd.is_message else None
+        if value is None:
+            # a late answer of a former request: the rest of the stream is dropped, see reread_obis
+            protocol.parser.clear()
+            if not cmd.is_message:
+                raise Session.SessionError('OBIS {} expected'.format(obis))
+            raise Session.SessionError('Wrong OBIS, expected {}: {}'.format(obis, cmd.data))
+    finally:
+        VERBOSE_LEVEL -= 1
+    dump(value)
+    return value
 
 
 def write_obis(protocol, obis, data):
-    dump('OBIS ' + obis + ': ' + data)
-    obis = obis.replace('.', '').replace('*', '')
+    obis = Obis.Obis(obis)
+    dump('OBIS ' + obis.display + ': ' + data)
+    if obis.display in Tariffs.SCHEDULE_OBIS:
+        tariff_schedules.invalidate()  # schedule changes: re-read by the next calculation
     global VERBOSE_LEVEL
     VERBOSE_LEVEL += 1
-    protocol.send(NevaMt3xx.NevaMt3xx.Command('W1', obis + '(' + data + ')'))
+    protocol.send_command('W1', obis.wire + '(' + data + ')')
     cmd = protocol.receive()
     if cmd.is_message:
         raise Exception('Write OBIS {} error: {}'.format(obis, cmd.data))
@@ -159,15 +203,11 @@ def write_obis(protocol, obis, data):
 def read_half_hours(days_ago=0):
     '''
     days_ago -- 0..127
-    returns list of day 48 half hour energies, W
+    returns tuple of day 48 half hour energies, W
     '''
     if 0 <= days_ago <= 127:
-        buff = read_obis(protocol, '63.01.00*' + '{:02X}'.format(
-            days_ago))  # Профиль нагрузки активной энергии получасовой: Х.Х.ХХ,...,Х.Х.ХХ (кВт, по 48 параметров: первые..последние 30 минут)
-        half_hour_energies = buff.split(',')
-        if len(half_hour_energies) != 48:
-            raise Exception('Wrong 63.01.00 answer: ' + str(buff))
-        return half_hour_energies
+        obis = HALF_HOURS_OBIS[days_ago]
+        return ObisDecoders.decode(obis, read_obis(protocol, obis))
     else:
         raise Exception('days_ago exceeded: ' + str(days_ago))
 
@@ -179,15 +219,15 @@ def print_half_hours(half_hour_energies, date_stamp=datetime.now(), rows_delimit
             t = timedelta(minutes=half_hour_index * 30)
             if type(half_hour_energy) is list:
                 ret.append(', '.join(
-                    ['{:02.2f}'.format(float(e) / 1000) if type(e) is not datetime else e.strftime('%H:%M') for e in
-                     half_hour_energy]))
+                    ['{}.{:02}'.format(e // 1000, e % 1000 // 10) if type(e) is not datetime else e.strftime('%H:%M')
+                     for e in half_hour_energy]))  # Wh -> kWh
             else:
-                ret.append('{:02}:{:02} {}'.format(t.seconds / 3600, t.seconds % 3600 / 60, half_hour_energy))
+                ret.append('{:02}:{:02} {}'.format(t.seconds // 3600, t.seconds % 3600 // 60, half_hour_energy))
         return ret
 
     date_stamp.replace(date_stamp.year, date_stamp.month, date_stamp.day, 0, 0, 0, 0)
     half_hour_index = 0
-    if type(half_hour_energies) is list and type(half_hour_energies[0]) is list:
+    if type(half_hour_energies) is list and type(half_hour_energies[0]) in (list, tuple):
         print_lines = [''] * 49  # date & 48 half hours
         for half_hour_energies2, days_ago in zip(half_hour_energies, range(len(half_hour_energies))):
             lines = get_day_print(half_hour_energies2, date_stamp - timedelta(days=days_ago))
@@ -211,129 +251,119 @@ def print_half_hours(half_hour_energies, date_stamp=datetime.now(), rows_delimit
             print(line)
 
 
+def export(columns, rows):
+    '''streams rows (datetime, values...) to --output in --format'''
+    binary = args.format == 'columnar'
+    if args.output == '-':
+        stream = sys.stdout.buffer if binary else sys.stdout
+    else:
+        stream = open(args.output, 'wb' if binary else 'w', **({} if binary else {'newline': ''}))
+    try:
+        with Exporters.make_exporter(args.format, stream, columns) as exporter:
+            exporter.write(args.address or args.port, rows)
+        dump('exported {} rows'.format(exporter.rows))
+    finally:
+        if stream not in (sys.stdout, sys.stdout.buffer):
+            stream.close()
+
+
 def read_day_tariffs_energies(days_ago=0):
     '''
     days_ago -- 0..127
-    returns list of day tariffs enirgies, kWh: [sum, T1, T2, T3, T4]
+    returns tuple of day tariffs enirgies, Wh: (sum, T1, T2, T3, T4)
     '''
     if 0 <= days_ago <= 127:
-        buff = read_obis(protocol, '0F.80.80*' + '{:02X}'.format(days_ago))
-        day_energies = buff.split(',')
-        if len(day_energies) != 5:
-            raise Exception('Wrong 0F.80.80 answer: ' + str(buff))
-        return day_energies
+        obis = DAY_TARIFFS_OBIS[days_ago]
+        return ObisDecoders.decode(obis, read_obis(protocol, obis))
     else:
         raise Exception('days_ago exceeded: ' + str(days_ago))
 
 
 def read_monts(monts_ago=0):
-    '''monts_ago -- 0..12'''
+    '''
+    monts_ago -- 0..12
+    returns tuple of tariffs enirgies, Wh: (sum, T1, T2, T3, T4)
+    '''
     if 0 <= monts_ago <= 12:
-        buff = read_obis(protocol, '0F.08.80*' + '{:02X}'.format(
-            monts_ago))  # Активная энергия нарастающим итогом: XXXXX.X.XX,...,ХХХХХ.Х.ХХ (кВт/ч, по 5 параметров: параметров энергия Т0-суммарный тариф,Т1,Т2,Т3,Т4)
-        mounts_energies = buff.split(',')
-        if len(mounts_energies) != 5:
-            raise Exception('Wrong 0F.08.80 answer: ' + str(buff))
-        return mounts_energies
+        obis = MONTHS_OBIS[monts_ago]
+        return ObisDecoders.decode(obis, read_obis(protocol, obis))
     else:
         raise Exception('monts_ago exceeded: ' + str(monts_ago))
 
 
+def reconnect():
+    '''connects again after link error'''
+    global protocol, connection
+    dump('Reconnect')
+    if ":" in args.port:
+        connection.close()
+        connection, client_address = sock.accept()
+        protocol = NevaMt3xx.NevaMt3xx_tcp(connection)
+    connect(protocol)
+    if not login(protocol, args.password):
+        raise Exception('Access denied')
+
+
+def reread_obis(obis):
+    '''read_obis of the current connection; after an error connects again, so the next code is read
+    in step with the meter answers'''
+    try:
+        return read_obis(protocol, obis)
+    except Session.SessionError:
+        reconnect()
+        raise
+
+
+def sync_archive(meter_id, days_ago, meter_clock=None):
+    '''reads days not in the archive (--archive); returns Archive.ArchiveSync'''
+    global VERBOSE_LEVEL
+    dump('Sync archive')
+    VERBOSE_LEVEL += 1
+    sync = Archive.ArchiveSync(archive, meter_id, lambda obis: read_obis(protocol, obis), meter_clock)
+    # every read day is stored in the archive: after link error the backfill continues from the first missing day
+    dates = sync.resume(depth=days_ago, reconnect=reconnect, retries=args.retries)
+    VERBOSE_LEVEL -= 1
+    dump('done: {} days, {} requests'.format(len(dates), sync.requests))
+    return sync
+
+
 def calculate_half_hours(start=datetime.now(), stop=None, days_ago=0):
-    '''returns list of list of 48 day's energies: [ [[sum, T1, T2, T3, T4]*48]*days ]'''
+    '''returns HalfHours.TariffTotals of days from start date to stop date: [sum, T1, T2, T3, T4]*48 per day, Wh'''
 
     def get_shedule_tariffs(obis, table_count):
-        '''returns list of date sorted year tariff shedule: ['MMDDTT' (TT - tariff number 1..; 7F - ordinary day)]'''
+        '''returns list of tariff shedule items: ['MMDDTT' or 'HHMMTT' (TT - tariff number 1..; 7F - ordinary day)]'''
         buff = read_obis(protocol, obis)
         ret = buff.split(',')
         if len(ret) != table_count:
-            Exception('Incorrect OBIS {}: {}'.format(obis, buff))
-        ret = [tariff for tariff in ret if int(tariff) != 0]  # remove empty (not used)
-        ret = sorted(ret)  # sort by date
-        return ret
-
-    def get_year_shedule_tariff(year_tariffs_shedule, day):
-        for year_day in year_tariffs_shedule:
-            if year_day.startswith(day):
-                return year_day[-2:] if int(year_day[-2:], 16) != 0x7F else None
-        return None
-
-    def get_day_shedule_tariffs(day_tariffs_shedule):
-        '''returns list of 48 (one per half hour) day tariff indexes'''
-        if len(day_tariffs_shedule) == 0:
-            return [1] * 48
-        if len(day_tariffs_shedule) == 1:
-            return [int(day_tariffs_shedule[0][-2:])] * 48
-        ret = []
-        tariffs_index, next_tariff_index = len(day_tariffs_shedule) - 1, 0
-        for half_hour_index in range(48):
-            half_hour = 30 * half_hour_index  # day minutes: 0..1410 = 00:00..23:30
-            half_hour = '{:02}{:02}'.format(half_hour / 60, half_hour % 60)
-            if next_tariff_index < len(day_tariffs_shedule) and day_tariffs_shedule[next_tariff_index].startswith(
-                    half_hour):
-                tariffs_index = next_tariff_index
-                next_tariff_index += 1
-            ret.append(int(day_tariffs_shedule[tariffs_index][-2:]))
+            raise Exception('Incorrect OBIS {}: {}'.format(obis, buff))
         return ret
 
     def get_tariffs_half_hours(request_date):
-        '''returns list of day 48 half hours of list datetime & energies: [ [sum, T1, T2, T3, T4]*48 ]'''
-        half_hours = []
-        meter_date = datetime.date(datetime.strptime(read_obis(protocol, '00.09.02*FF'), '%y%m%d'))  # ГГММДД
+        '''returns array of day 48 half hours energies, Wh: [sum, T1, T2, T3, T4]*48'''
+        # meter date does not change while the day is read: two requests
+        meter_date = meter_clock.date(duration=DAY_READ_DURATION)
         # print('request_date: ', request_date, '; meter_date: ', meter_date)
-        for date_changed_tries_counter in range(3):
-            i = (meter_date - request_date).days
-            if i < 0:
-                Exception('Can\'t work at future: request date {}; meter date {}'.format(request_date, meter_date))
-            # print('days_ago: '+str(i))
-            # get list of day tariffs enirgies, kWh: [sum, T1, T2, T3, T4]
-            day_tariffs_energies = read_day_tariffs_energies(i)
-            day_tariffs_energies = [int(float(e) * 1000) for e in day_tariffs_energies]  # kWh -> Wh
-            # print('day_tariffs_energies = ', day_tariffs_energies)
-            # get list of day 48 half hour energies, W
-            day_half_hours = read_half_hours(i)
-            # print('half_hours = ', day_half_hours)
-            day = datetime.now().strftime('%m%d')
-            tariff_index = get_year_shedule_tariff(year_tariffs_shedule, day)
-            if tariff_index is not None:
-                # special day - tried all day half hours as one tariff
-                for half_hour in day_half_hours:
-                    tariff_index = int(tariff_index)
-                    if not (0 < tariff_index <= 4):
-                        raise Exception('Tariff index out of range (1..4): ' + str(tariff_index))
-                    half_hour = int(half_hour) / 2
-                    day_tariffs_energies[0] += half_hour  # sum
-                    day_tariffs_energies[tariff_index] += half_hour  # Tx
-                    half_hours.append(day_tariffs_energies[:])
-            else:
-                if len(day_tariff_indexes) != len(day_half_hours):
-                    raise Exception('Can\'t build day tariff table')
-                for tariff_index, half_hour in zip(day_tariff_indexes, day_half_hours):
-                    if not (0 < tariff_index <= 4):
-                        raise Exception('Tariff index out of range (1..4): ' + str(tariff_index))
-                    half_hour = int(half_hour) / 2
-                    day_tariffs_energies[0] += half_hour  # sum
-                    day_tariffs_energies[tariff_index] += half_hour  # Tx
-                    # print('half_hour, tariff_index = ', half_hour, tariff_index)
-                    half_hours.append(day_tariffs_energies[:])
-            # Check whether the meter date changed
-            meter_date2 = datetime.date(datetime.strptime(read_obis(protocol, '00.09.02*FF'), '%y%m%d'))  # ГГММДД
-            if meter_date == meter_date2:
-                break
-            half_hours = []
-            if date_changed_tries_counter > 1:
-                Exception('Can\'t read date')
-            meter_date = meter_date2
-        return half_hours
-
+        i = (meter_date - request_date).days
+        if i < 0:
+            raise Exception('Can\'t work at future: request date {}; meter date {}'.format(request_date, meter_date))
+        # print('days_ago: '+str(i))
+        # get day tariffs enirgies, Wh: (sum, T1, T2, T3, T4)
+        day_tariffs_energies = read_day_tariffs_energies(i)
+        # get list of day 48 half hour energies, W
+        day_half_hours = read_half_hours(i)
+        # print('half_hours = ', day_half_hours)
+        return Tariffs.allocate_day(day_tariffs_energies, day_half_hours, masks(request_date))
+
+    # meter date & time are read once, see MeterClock
+    meter_clock = MeterClock.MeterClock(lambda obis: read_obis(protocol, obis))
     # get half hours & using it according to the tariff table
-    # get list of date sorted year tariff shedule: ['MMDDTT' (TT - tariff number 1..; 7F - ordinary day)]
-    year_tariffs_shedule = get_shedule_tariffs('0B.00.00*FF', 32)
-    # print('year_tariffs_shedule = ', year_tariffs_shedule)
-    # get list of 48 (one per half hour) day tariff indexes
-    day_tariff_indexes = get_day_shedule_tariffs(get_shedule_tariffs('0A.01.64*FF', 8))
-    # print('day_tariff_indexes = ', day_tariff_indexes)
-    half_hours = []
+    # year tariff shedule: ['MMDDTT' (TT - tariff number 1..; 7F - ordinary day)]
+    # day tariff shedule: ['HHMMTT']
+    # read once per meter & kept in tariff_schedules
+    meter_id = read_obis(protocol, '60.01.00*FF')  # ID счетчика
+    masks = tariff_schedules.get(meter_id,
+                                 lambda: (get_shedule_tariffs(Tariffs.DAY_SCHEDULE_OBIS, 8),
+                                         get_shedule_tariffs(Tariffs.YEAR_SCHEDULE_OBIS, 32)))
     if stop is None:
         if days_ago == 0:
             stop = datetime(start.year, start.month, start.day, 23, 59, 59)
@@ -342,31 +372,32 @@ def calculate_half_hours(start=datetime.now(), stop=None, days_ago=0):
     # print('start:', start, '; stop:', stop)
     start_date = datetime.date(start)
     stop_date = datetime.date(stop)
+    half_hours = HalfHours.TariffTotals(start_date)
+    # window: first half hour of start date, last half hour of stop date (indexes, inclusive)
+    t = start - datetime(start_date.year, start_date.month, start_date.day)
+    half_hours.first = t.seconds // 1800 + (1 if t.seconds % 1800 > 0 else 0)
+    t = stop - datetime(stop_date.year, stop_date.month, stop_date.day)
+    half_hours.last = t.seconds // 1800
+    if archive is not None:
+        # read the new days only & calculate from the archive
+        sync_archive(meter_id, (meter_clock.date(DAY_READ_DURATION) - stop_date).days, meter_clock)
+        # past days are calculated once per tariff schedule version, see TariffCache
+        totals = tariff_cache.allocate(meter_id, archive, masks, start_date, (start_date - stop_date).days + 1)
+        totals.first, totals.last = half_hours.first, half_hours.last
+        return totals
     date = start_date
     while date >= stop_date:
-        # get list (48 half hour) of list (5: sum, T1, T2, T3, T4)
-        start_half_hour_index, stop_half_hour_index = 0, 47  # indexes, inclusive
-        half_hours2 = get_tariffs_half_hours(date)  # [ [sum, T1, T2, T3, T4]*48 ]
-        # add datetime: [ [sum, T1, T2, T3, T4]*48 ] -> [ [datetime, sum, T1, T2, T3, T4]*48 ]
-        half_hours2 = [[datetime(date.year, date.month, date.day, int(hh_index / 2), int(hh_index * 30 % 60))] + hh for
-                       hh, hh_index in zip(half_hours2, range(len(half_hours2)))]
-        # print('len(half_hours2): ', len(half_hours2), '; half_hours2: ', half_hours2)
-        if date == start_date:
-            t = start - datetime(date.year, date.month, date.day)
-            start_half_hour_index = t.seconds / 1800 + (1 if t.seconds % 1800 > 0 else 0)
-            # print('start_half_hour_index:', start_half_hour_index, '; t.seconds: ', t.seconds)
-        if date == stop_date:
-            t = stop - datetime(date.year, date.month, date.day)
-            stop_half_hour_index = t.seconds / 1800
-            # print('stop_half_hour_index:', stop_half_hour_index, '; t.seconds: ', t.seconds)
-        half_hours.append(half_hours2[int(start_half_hour_index):int(stop_half_hour_index) + 1])
-        # print('half_hours2: ', half_hours2[int(start_half_hour_index):int(stop_half_hour_index)+1])
+        # get day 48 half hours of 5: sum, T1, T2, T3, T4
+        half_hours.append(get_tariffs_half_hours(date))
         date -= timedelta(days=1)
     return half_hours
 
 
 args = pase_args()
 VERBOSE_LEVEL = args.v
+tariff_schedules = Tariffs.TariffScheduleStore(args.schedule_cache)
+archive = None if args.archive is None else ColumnStore.ColumnStore(args.archive)
+tariff_cache = None if args.archive is None else TariffCache.TariffCache(args.archive)
 
 if not sys.platform.startswith('win') and args.port.find('/') < 0:
     args.port = '/dev/' + args.port
@@ -408,54 +439,76 @@ try:
         protocol = NevaMt3xx.NevaMt3xx_tcp(connection)
     else:
         protocol = NevaMt3xx.NevaMt3xx_com(port, l, args.v > 2)
-    connect(protocol)
-    if not login(protocol, args.password):
-        raise Exception('Access denied')
-
-    if args.obis is not None:
-        for obis in args.obis:
-            print(read_obis(protocol, obis))
-
-    # buff = read_obis(protocol, '00.09.02*FF') # Дата: ГГММДД
-    # buff = read_obis(protocol, '60.01.01*FF') # Адрес счетчика: XXXXXXXX
-    # buff = read_obis(protocol, '60.01.00*FF') # ID счетчика: XXXXXXXXXXXX
-    # buff = read_obis(protocol, '60.01.04*FF') # Модель счетчика: XXXXXXXX
-    # buff = read_obis(protocol, '60.01.0A*FF') # Место установки: XXXXXXXXXXXXXXXX
-    # buff = read_obis(protocol, '60.09.00*FF') # Температура (НЕВА МТ323, НЕВА MT314 XXSR): XXX
-
-    if args.half_hours is not None:
-        if 0 <= args.half_hours <= 127:
-            half_hours = []
-            for i in range(0, args.half_hours + 1):
-                half_hours.append(read_half_hours(i))
-            print_half_hours(half_hours, datetime.now())
-        else:
-            raise Exception('half-hours not in range 0..127: ' + str(args.half_hours))
-
-    elif args.calc_half_hours is not None:
-        if 0 <= args.calc_half_hours <= 127:
-            start = datetime.now()
-            start = datetime(start.year, start.month, start.day)
-            if args.calc_half_hours == 0:
-                stop = start
+    if args.readout:
+        readout(protocol)
+    else:
+        connect(protocol)
+        if not login(protocol, args.password):
+            raise Exception('Access denied')
+
+        if args.obis is not None:
+            snapshot = Snapshot.read_many(reread_obis, args.obis, decode=False)
+            for obis in snapshot:
+                dump('{}: {:.3f} s'.format(obis, snapshot.timings[obis]), 1)
+                print(snapshot.errors[obis] if obis in snapshot.errors else snapshot.raw[obis])
+
+        # buff = read_obis(protocol, '00.09.02*FF') # Дата: ГГММДД
+        # buff = read_obis(protocol, '60.01.01*FF') # Адрес счетчика: XXXXXXXX
+        # buff = read_obis(protocol, '60.01.00*FF') # ID счетчика: XXXXXXXXXXXX
+        # buff = read_obis(protocol, '60.01.04*FF') # Модель счетчика: XXXXXXXX
+        # buff = read_obis(protocol, '60.01.0A*FF') # Место установки: XXXXXXXXXXXXXXXX
+        # buff = read_obis(protocol, '60.09.00*FF') # Температура (НЕВА МТ323, НЕВА MT314 XXSR): XXX
+
+        if args.sync is not None:
+            if archive is None:
+                raise Exception('--archive expected for --sync')
+            if not 0 <= args.sync <= 127:
+                raise Exception('sync not in range 0..127: ' + str(args.sync))
+            sync = sync_archive(read_obis(protocol, '60.01.00*FF'), args.sync)
+            dump('Sync months')
+            dump('done: {} months'.format(len(sync.sync_months())))
+
+        if args.half_hours is not None:
+            if 0 <= args.half_hours <= 127:
+                if archive is not None:
+                    sync = sync_archive(read_obis(protocol, '60.01.00*FF'), args.half_hours)
+                    half_hours, _ = archive.load(sync.meter, sync.clock.date(), args.half_hours + 1)
+                else:
+                    half_hours = HalfHours.HalfHourProfile(datetime.now())
+                    for i in range(0, args.half_hours + 1):
+                        half_hours.append(read_half_hours(i))
+                if args.format == 'text':
+                    print_half_hours([day.tolist() for day in half_hours], datetime.now())
+                else:
+                    export(Exporters.PROFILE_COLUMNS, Exporters.profile_rows(half_hours))
             else:
-                stop = start - timedelta(days=args.calc_half_hours)
-            stop = datetime(stop.year, stop.month, stop.day, 23, 59, 59)
-            # print('start: ', start, 'stop: ', stop)
-            half_hours = calculate_half_hours(start=start, stop=stop)
-            # print('half_hours: ', half_hours)
-            for half_hour, half_hour_index in zip(half_hours, range(len(half_hours))):
-                hh = 30 * (half_hour_index % 48)  # day minutes: 0..1410 = 00:00..23:30
-                hh = '{:02}:{:02}'.format(hh / 60, hh % 60)
-            # add missing half hours into the list for correct print
-            half_hours[0] = [''] * (48 - len(half_hours[0])) + half_hours[0]
-            # print(half_hours[0])
-            print_half_hours(half_hours, rows_delimiter=' | ')
-        else:
-            raise Exception('calc-half-hours not in range 0..127: ' + str(args.calc_half_hours))
+                raise Exception('half-hours not in range 0..127: ' + str(args.half_hours))
+
+        elif args.calc_half_hours is not None:
+            if 0 <= args.calc_half_hours <= 127:
+                start = datetime.now()
+                start = datetime(start.year, start.month, start.day)
+                if args.calc_half_hours == 0:
+                    stop = start
+                else:
+                    stop = start - timedelta(days=args.calc_half_hours)
+                stop = datetime(stop.year, stop.month, stop.day, 23, 59, 59)
+                # print('start: ', start, 'stop: ', stop)
+                half_hours = calculate_half_hours(start=start, stop=stop)
+                if args.format == 'text':
+                    half_hours = half_hours.to_lists()
+                    # print('half_hours: ', half_hours)
+                    # add missing half hours into the list for correct print
+                    half_hours[0] = [''] * (48 - len(half_hours[0])) + half_hours[0]
+                    # print(half_hours[0])
+                    print_half_hours(half_hours, rows_delimiter=' | ')
+                else:
+                    export(Exporters.TARIFF_COLUMNS, Exporters.tariff_rows(half_hours))
+            else:
+                raise Exception('calc-half-hours not in range 0..127: ' + str(args.calc_half_hours))
 
-    # write_obis(protocol, '60.01.01*FF', '00009144') # Адрес счетчика: XXXXXXXX
-    logout(protocol)
+        # write_obis(protocol, '60.01.01*FF', '00009144') # Адрес счетчика: XXXXXXXX
+        logout(protocol)
 
     if ":" in args.port:
         sock.close()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python2
+# -*- coding: UTF-8 -*-
+
+# Проверка восстановления сеанса (Session.read) после запоздавшего ответа счётчика без счётчика:
+# python test_session.py или python -m pytest test_session.py
+
+from library import Mek61107, Session
+
+VALUES = {
+    '600100FF': '12345678',  # ID счетчика
+    '600101FF': '9144',  # Адрес счетчика
+    '600104FF': 'MT324',  # Модель счетчика
+}
+
+
+class LateMeter(Mek61107.Mek61107):
+    '''the link of a meter answering R1 from VALUES; the answer of the request number late arrives
+    after the receive timeout, together with the answer of the next request'''
+
+    def __init__(self, late=None):
+        Mek61107.Mek61107.__init__(self)
+        self.parser = self.make_parser()
+        self.late = late
+        self.requests = []  # wire OBIS of R1
+        self.connects = 0
+        self.chunks = []  # received bytes of the next receive() calls
+        self.delayed = b''
+
+    def connect(self, address=''):
+        self.connects += 1
+        return 'NEV', 'MT324'
+
+    def login(self, password):
+        return True
+
+    def logout(self, pause=None):
+        pass
+
+    def send_command(self, command, data=''):
+        wire = data[:8]
+        self.requests.append(wire)
+        answer = self.serialize_frame(Mek61107.Mek61107.Message(wire + '(' + VALUES[wire] + ')'))
+        if len(self.requests) == self.late:
+            self.delayed = answer
+            self.chunks.append(b'')  # receive timeout
+        else:
+            self.chunks.append(self.delayed + answer)
+            self.delayed = b''
+
+    def receive(self):
+        chunk = self.chunks.pop(0) if self.chunks else b''
+        for cmd in self.parser.feed(chunk):
+            return cmd
+        self.parser.clear()
+        return Mek61107.Mek61107.CommandBase()
+
+
+def test_read_recovers_after_late_answer():
+    meter = LateMeter(late=1)
+    session = Session.Session(meter, retries=1)
+    # the retry takes the late answer, the answer of the retry is left in the stream
+    assert session.read('60.01.00*FF') == '12345678'
+    try:
+        session.read('60.01.01*FF')
+    except Session.SessionError:
+        pass
+    else:
+        raise AssertionError('SessionError expected')
+    assert not session.is_open and len(meter.parser) == 0
+    # the next codes are read after re-connection, the answers are in step again
+    assert session.read('60.01.04*FF') == 'MT324'
+    assert session.read('60.01.01*FF') == '9144'
+    assert meter.connects == 3
+
+
+def test_read_many_recovers_after_late_answer():
+    meter = LateMeter(late=1)
+    snapshot = Session.Session(meter, retries=1).read_many(['60.01.00*FF', '60.01.01*FF', '60.01.04*FF'], decode=False)
+    assert list(snapshot.errors) == [snapshot.codes[1]]
+    assert snapshot.get('60.01.00*FF') == '12345678' and snapshot.get('60.01.04*FF') == 'MT324'
+
+
+if __name__ == '__main__':
+    test_read_recovers_after_late_answer()
+    test_read_many_recovers_after_late_answer()
+    print('ok')